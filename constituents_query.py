@@ -0,0 +1,163 @@
+"""
+Point-in-time queries over the constituents store. Each ETF's history is
+loaded once into a compressed sparse weight matrix (holdings dates by
+permatickers), kept in CSR form for date slices and CSC form for per-name
+series, plus an interval index of each permaticker's entry and exit dates.
+Indexes are built on first use, shared through a module registry and rebuilt
+whenever the store's date index is rewritten, which covers restated days as
+well as new ones.
+"""
+
+import os
+from os.path import join
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from constituents_store import INDEX_FILE, STORE_PATH, get_dates, read_history
+
+# Loaded indexes by (store path, etf), as (date index mtime, ConstituentIndex)
+_indexes = {}
+
+
+def to_day(date):
+    return np.datetime64(pd.Timestamp(date).date(), 'D')
+
+
+class ConstituentIndex:
+    def __init__(self, history):
+        """
+        history is the long (date, permaticker, weight) frame from
+        read_history. Dates are held as datetime64[D], so lookups are binary
+        searches on a plain array.
+        """
+        dates = pd.to_datetime(history['date']).values.astype('datetime64[D]')
+        self.dates, row = np.unique(dates, return_inverse=True)
+        self.permatickers, col = np.unique(history['permaticker'].values.astype('int64'), return_inverse=True)
+        shape = (len(self.dates), len(self.permatickers))
+        self.weights = sparse.csr_matrix((history['weight'].values.astype(float), (row, col)), shape=shape)
+        self.weights.sort_indices()
+        self.weights_csc = self.weights.tocsc()
+        self.build_intervals()
+
+    def build_intervals(self):
+        # Runs of consecutive holdings dates per permaticker, as date positions
+        csc = self.weights_csc
+        perms, starts, ends = [], [], []
+        for j in range(len(self.permatickers)):
+            rows = csc.indices[csc.indptr[j]:csc.indptr[j + 1]]
+            if not len(rows):
+                continue
+            breaks = np.flatnonzero(np.diff(rows) > 1)
+            perms.append(np.full(len(breaks) + 1, j))
+            starts.append(rows[np.r_[0, breaks + 1]])
+            ends.append(rows[np.r_[breaks, len(rows) - 1]])
+        self.interval_col = np.concatenate(perms) if perms else np.zeros(0, dtype=np.int64)
+        self.interval_start = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+        self.interval_end = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+
+    def date_pos(self, date):
+        # Position of the last holdings date on or before date, -1 if none
+        return np.searchsorted(self.dates, to_day(date), side='right') - 1
+
+    def row(self, pos):
+        start, end = self.weights.indptr[pos], self.weights.indptr[pos + 1]
+        return self.weights.indices[start:end], self.weights.data[start:end]
+
+    def members_asof(self, date):
+        pos = self.date_pos(date)
+        if pos < 0:
+            return np.zeros(0, dtype=np.int64)
+        return self.permatickers[self.row(pos)[0]]
+
+    def weights_asof(self, date):
+        pos = self.date_pos(date)
+        if pos < 0:
+            return pd.Series(dtype=float)
+        cols, values = self.row(pos)
+        return pd.Series(values, index=pd.Index(self.permatickers[cols], name='permaticker'),
+                         name=pd.Timestamp(self.dates[pos]))
+
+    def members_between(self, start, end):
+        """
+        Permatickers held on any holdings date in effect during [start, end],
+        including the as-of date for start.
+        """
+        lo = max(self.date_pos(start), 0)
+        hi = self.date_pos(end)
+        if hi < lo:
+            return np.zeros(0, dtype=np.int64)
+        hit = (self.interval_start <= hi) & (self.interval_end >= lo)
+        return self.permatickers[np.unique(self.interval_col[hit])]
+
+    def membership_changes(self, date_a, date_b):
+        # (added, removed) permatickers between the as-of holdings of two dates
+        a = self.members_asof(date_a)
+        b = self.members_asof(date_b)
+        return np.setdiff1d(b, a, assume_unique=True), np.setdiff1d(a, b, assume_unique=True)
+
+    def weight_series(self, permaticker, start=None, end=None):
+        j = np.searchsorted(self.permatickers, permaticker)
+        if j == len(self.permatickers) or self.permatickers[j] != permaticker:
+            return pd.Series(dtype=float)
+        csc = self.weights_csc
+        rows = csc.indices[csc.indptr[j]:csc.indptr[j + 1]]
+        values = csc.data[csc.indptr[j]:csc.indptr[j + 1]]
+        lo = 0 if start is None else np.searchsorted(self.dates[rows], to_day(start))
+        hi = len(rows) if end is None else np.searchsorted(self.dates[rows], to_day(end), side='right')
+        return pd.Series(values[lo:hi], index=pd.DatetimeIndex(self.dates[rows[lo:hi]]), name=permaticker)
+
+    def weights_between(self, start, end):
+        # Dense dates by permatickers frame, limited to names held in the range
+        lo = max(self.date_pos(start), 0)
+        hi = self.date_pos(end)
+        block = self.weights[lo:hi + 1]
+        cols = np.unique(block.indices)
+        return pd.DataFrame(block[:, cols].toarray(), index=pd.DatetimeIndex(self.dates[lo:hi + 1]),
+                            columns=self.permatickers[cols])
+
+    def intervals(self, permaticker=None):
+        df = pd.DataFrame({'permaticker': self.permatickers[self.interval_col],
+                           'entry': pd.DatetimeIndex(self.dates[self.interval_start]),
+                           'exit': pd.DatetimeIndex(self.dates[self.interval_end])})
+        if permaticker is not None:
+            df = df[df['permaticker'] == permaticker]
+        return df.reset_index(drop=True)
+
+
+def get_index(etf, store_path=STORE_PATH):
+    dates = get_dates(etf, store_path)
+    if not dates:
+        raise KeyError('No constituents stored for {}'.format(etf))
+    # write_partitions rewrites the date index on every write, restatements included
+    mtime = os.stat(join(store_path, etf, INDEX_FILE)).st_mtime_ns
+    key = (store_path, etf)
+    cached = _indexes.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    index = ConstituentIndex(read_history(etf, store_path=store_path))
+    _indexes[key] = (mtime, index)
+    return index
+
+
+def members_asof(etf, date, store_path=STORE_PATH):
+    return get_index(etf, store_path).members_asof(date)
+
+
+def weights_asof(etf, date, store_path=STORE_PATH):
+    return get_index(etf, store_path).weights_asof(date)
+
+
+def members_between(etf, start, end, store_path=STORE_PATH):
+    return get_index(etf, store_path).members_between(start, end)
+
+
+def membership_changes(etf, date_a, date_b, store_path=STORE_PATH):
+    return get_index(etf, store_path).membership_changes(date_a, date_b)
+
+
+def weight_series(etf, permaticker, start=None, end=None, store_path=STORE_PATH):
+    return get_index(etf, store_path).weight_series(permaticker, start, end)
+
+
+def weights_between(etf, start, end, store_path=STORE_PATH):
+    return get_index(etf, store_path).weights_between(start, end)
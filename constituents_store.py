@@ -0,0 +1,171 @@
+"""
+Long-format, date-partitioned store for ETF constituent weights. Each holdings
+day is one small Parquet file of (permaticker, weight) under the ETF's
+directory, and a sorted date index per ETF lets "weights as of date D" open
+exactly one partition. Adding a day writes one file instead of rewriting the
+whole wide <etf>_constits.csv history.
+"""
+
+from bisect import bisect_left, bisect_right
+import json
+import os
+from os.path import join
+from pathlib import Path
+import logging
+import pandas as pd
+
+FUNDAMENTALS_PATH = join(Path.home(), '.zipline', 'data', 'fundamentals')
+STORE_PATH = join(FUNDAMENTALS_PATH, 'constituents')
+INDEX_FILE = '_dates.json'
+
+# Partition dates per ETF directory, as (index mtime, sorted list of 'YYYY-MM-DD')
+_dates_cache = {}
+
+
+def partition_file(etf, fdate, store_path=STORE_PATH):
+    return join(store_path, etf, 'date={}.parquet'.format(fdate))
+
+
+def to_date_str(fdate):
+    return pd.Timestamp(fdate).strftime('%Y-%m-%d')
+
+
+def get_dates(etf, store_path=STORE_PATH):
+    fname = join(store_path, etf, INDEX_FILE)
+    if not os.path.isfile(fname):
+        return []
+    mtime = os.path.getmtime(fname)
+    cached = _dates_cache.get(fname)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(fname) as f:
+        dates = sorted(json.load(f))
+    _dates_cache[fname] = (mtime, dates)
+    return dates
+
+
+def write_dates(etf, dates, store_path=STORE_PATH):
+    fname = join(store_path, etf, INDEX_FILE)
+    dates = sorted(set(dates))
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(dates, f)
+    os.replace(fname + '.tmp', fname)
+    _dates_cache[fname] = (os.path.getmtime(fname), dates)
+
+
+def get_etfs(store_path=STORE_PATH):
+    if not os.path.isdir(store_path):
+        return []
+    return sorted(d for d in os.listdir(store_path) if os.path.isfile(join(store_path, d, INDEX_FILE)))
+
+
+def to_partition(weights):
+    # weights is a Series indexed by permaticker
+    weights = weights.dropna()
+    return pd.DataFrame({'permaticker': weights.index.values.astype(float).astype('int64'),
+                         'weight': weights.values.astype('float64')})
+
+
+def write_partitions(etf, weights_by_date, store_path=STORE_PATH):
+    """
+    Writes one partition per date from a dict of date -> weights Series and
+    updates the date index once at the end. Existing partitions for the same
+    dates are replaced.
+    """
+    fpath = join(store_path, etf)
+    if not os.path.isdir(fpath):
+        os.makedirs(fpath)
+    dates = list(get_dates(etf, store_path))
+    for fdate, weights in weights_by_date.items():
+        fdate = to_date_str(fdate)
+        fname = partition_file(etf, fdate, store_path)
+        to_partition(weights).to_parquet(fname + '.tmp', index=False)
+        os.replace(fname + '.tmp', fname)
+        dates.append(fdate)
+    write_dates(etf, dates, store_path)
+
+
+def write_partition(etf, fdate, weights, store_path=STORE_PATH):
+    write_partitions(etf, {fdate: weights}, store_path)
+
+
+def read_partition(etf, fdate, store_path=STORE_PATH):
+    df = pd.read_parquet(partition_file(etf, to_date_str(fdate), store_path))
+    return df.set_index('permaticker')['weight']
+
+
+def get_asof_date(etf, asof, store_path=STORE_PATH):
+    # Latest partition date on or before asof, None if the history starts later
+    dates = get_dates(etf, store_path)
+    i = bisect_right(dates, to_date_str(asof))
+    return dates[i - 1] if i else None
+
+
+def get_weights_asof(etf, asof, store_path=STORE_PATH):
+    fdate = get_asof_date(etf, asof, store_path)
+    if fdate is None:
+        return None
+    weights = read_partition(etf, fdate, store_path)
+    weights.name = pd.Timestamp(fdate)
+    return weights
+
+
+def read_history(etf, start=None, end=None, store_path=STORE_PATH):
+    # Long (date, permaticker, weight) frame for the partitions in [start, end]
+    dates = get_dates(etf, store_path)
+    lo = 0 if start is None else bisect_left(dates, to_date_str(start))
+    hi = len(dates) if end is None else bisect_right(dates, to_date_str(end))
+    frames = []
+    for fdate in dates[lo:hi]:
+        df = pd.read_parquet(partition_file(etf, fdate, store_path))
+        df.insert(0, 'date', pd.Timestamp(fdate))
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=['date', 'permaticker', 'weight'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def to_wide(history):
+    # Dates by permaticker, the layout of the old <etf>_constits.csv
+    wide = history.pivot(index='date', columns='permaticker', values='weight')
+    wide.columns.name = None
+    wide.index.name = None
+    return wide
+
+
+def migrate_wide_csv(etf, csv_path, store_path=STORE_PATH):
+    """
+    One-time import of a wide <etf>_constits.csv (dates by permaticker) into
+    the store. Dates already in the store are left alone.
+    """
+    hf = pd.read_csv(csv_path, index_col=0)
+    hf.columns = hf.columns.astype(float)
+    hf.index = pd.to_datetime(hf.index)
+    existing = set(get_dates(etf, store_path))
+    weights_by_date = {fdate: row for fdate, row in hf.iterrows() if to_date_str(fdate) not in existing}
+    if weights_by_date:
+        write_partitions(etf, weights_by_date, store_path)
+    logging.info('Migrated {} dates for {}'.format(len(weights_by_date), etf))
+    return len(weights_by_date)
+
+
+def export_wide_csv(etf, csv_path, store_path=STORE_PATH):
+    """
+    Rewrites <etf>_constits.csv from the store, for the zipline loaders that
+    still read the wide file. Permaticker columns are written as floats, as
+    the file always had them.
+    """
+    wide = to_wide(read_history(etf, store_path=store_path))
+    wide.columns = wide.columns.astype(float)
+    fdir = os.path.dirname(csv_path)
+    if fdir and not os.path.isdir(fdir):
+        os.makedirs(fdir)
+    wide.to_csv(csv_path + '.tmp')
+    os.replace(csv_path + '.tmp', csv_path)
+
+
+def migrate_all(fundamentals_path=FUNDAMENTALS_PATH, store_path=STORE_PATH):
+    suffix = '_constits.csv'
+    for fname in sorted(os.listdir(fundamentals_path)):
+        if fname.endswith(suffix):
+            migrate_wide_csv(fname[:-len(suffix)], join(fundamentals_path, fname), store_path)
@@ -0,0 +1,111 @@
+"""
+Bulk DataFrame writers for openpyxl worksheets. Cells are addressed by row and
+column number, so frames of any width can be written, and a block can
+optionally be diffed against what is already in the sheet so only changed
+cells are touched.
+"""
+
+from time import perf_counter
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.worksheet.table import Table
+
+
+def to_cell_values(df):
+    # Plain python values with NaN written as empty cells
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+
+def write_df_excel(df, start_col, start_row, sheet, include_cols=False, diff=False):
+    # cell(value=None) leaves the old contents in place, so values are assigned
+    # directly to let missing values clear the cell
+    col0 = column_index_from_string(start_col) if isinstance(start_col, str) else start_col
+    row0 = start_row
+    if include_cols:
+        for j, name in enumerate(df.columns):
+            sheet.cell(row=row0, column=col0 + j, value=name)
+        row0 += 1
+    values = to_cell_values(df)
+    if diff and len(df):
+        old_rows = sheet.iter_rows(min_row=row0, max_row=row0 + len(df) - 1,
+                                   min_col=col0, max_col=col0 + len(df.columns) - 1,
+                                   values_only=True)
+        for i, (row, old_row) in enumerate(zip(values, old_rows)):
+            for j, (value, old_value) in enumerate(zip(row, old_row)):
+                if value != old_value:
+                    sheet.cell(row=row0 + i, column=col0 + j).value = value
+    else:
+        for i, row in enumerate(values):
+            for j, value in enumerate(row):
+                sheet.cell(row=row0 + i, column=col0 + j).value = value
+
+
+def replace_table(sheet, df, display_name, fallback_names=(), diff=False):
+    # Reuse the style of the existing table, which may still have its default name
+    style = None
+    for name in [display_name] + list(fallback_names):
+        if name in sheet.tables:
+            style = sheet.tables[name].tableStyleInfo
+            del sheet.tables[name]
+            break
+
+    # Only trim what lies outside the new block, the rest is overwritten
+    n_rows = len(df) + 1
+    n_cols = len(df.columns)
+    if sheet.max_row > n_rows:
+        sheet.delete_rows(n_rows + 1, sheet.max_row - n_rows)
+    if sheet.max_column > n_cols:
+        sheet.delete_cols(n_cols + 1, sheet.max_column - n_cols)
+    write_df_excel(df, 1, 1, sheet, include_cols=True, diff=diff)
+
+    table = Table(displayName=display_name, ref='A1:{}{}'.format(get_column_letter(n_cols), n_rows))
+    if style is not None:
+        table.tableStyleInfo = style
+    sheet.add_table(table)
+
+
+def legacy_insert_df_excel(df, start_col, start_row, sheet, include_cols=False):
+    # Previous cell-by-cell writer, kept for benchmarking. Only handles columns A-Z.
+    col_list = [chr(i) for i in range(ord(start_col),ord(chr(ord(start_col)+len(df.columns)-1))+1)]
+    col_dict = dict(zip(col_list, df.columns))
+    spacer = 0
+    if include_cols:
+        spacer = 1
+        for col in col_list:
+            rowpos = ord(col)-64
+            cell = str(col+str(1))
+            sheet[cell] = df.columns[rowpos-1]
+    for key, value in col_dict.items():
+        for i in range(len(df)):
+            row = start_row+i+spacer
+            cell = str(key+str(row))
+            sheet[cell] = df[value][i]
+
+
+def benchmark_excel_writers(n_rows=10000, n_cols=30, changed_frac=0.1, seed=None):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(np.round(rng.standard_normal((n_rows, n_cols)), 4),
+                      columns=['col{}'.format(i) for i in range(n_cols)])
+    changed = df.copy()
+    mask = rng.random(df.shape) < changed_frac
+    changed = changed.mask(mask, changed + 1)
+
+    def run(writer, frame, sheet, **kwargs):
+        start = perf_counter()
+        writer(frame, 'A', 1, sheet, include_cols=True, **kwargs)
+        return perf_counter() - start
+
+    results = {}
+    legacy_df = df.iloc[:, :min(n_cols, 26)]
+    results['legacy (A-Z only)'] = (run(legacy_insert_df_excel, legacy_df, Workbook().active),
+                                    legacy_df.size)
+    sheet = Workbook().active
+    results['bulk'] = (run(write_df_excel, df, sheet), df.size)
+    results['bulk diff, unchanged'] = (run(write_df_excel, df, sheet, diff=True), df.size)
+    results['bulk diff, {:.0%} changed'.format(changed_frac)] = (
+        run(write_df_excel, changed, sheet, diff=True), df.size)
+    bdf = pd.DataFrame.from_dict(results, orient='index', columns=['seconds', 'cells'])
+    bdf['cells_per_sec'] = bdf['cells'] / bdf['seconds']
+    return bdf
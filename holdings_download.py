@@ -0,0 +1,170 @@
+"""
+Concurrent downloads of the raw iShares and SPDR holdings files. All files
+are fetched over one pooled session with retries and written straight to a
+fixed path per ETF. A headless Chrome is only started for the files a plain
+request could not fetch, and it is shared by all of them.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+from os.path import join
+from pathlib import Path
+import logging
+import shutil
+import tempfile
+from time import sleep, perf_counter
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RAW_PATH = join(Path.home(), '.zipline', 'custom_data', 'raw_holdings')
+ISHARES_URL = 'https://www.ishares.com/us/products/{}/1467271812596.ajax?fileType=csv&fileName={}_holdings&dataType=fund'
+ISHARES_PRODUCTS = {'iwm': '239710/ishares-russell-2000-etf',
+                    'iwb': '239707/ishares-russell-1000-etf',
+                    'iwv': '239714/ishares-russell-3000-etf'}
+SPDR_URL = 'https://www.ssga.com/us/en/intermediary/etfs/library-content/products/fund-data/etfs/us/holdings-daily-us-en-{}.xlsx'
+SPDR_TICKERS = ['spy', 'xlb', 'xlc', 'xle', 'xlf', 'xli', 'xlk', 'xlp', 'xlre', 'xlu', 'xlv', 'xly']
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+
+
+class Source:
+    def __init__(self, url, ext, method='GET'):
+        self.url = url
+        self.ext = ext
+        self.method = method
+
+
+def get_sources(ishares_url=ISHARES_URL, spdr_url=SPDR_URL):
+    # The url templates can point at a local server for testing
+    sources = {etf: Source(ishares_url.format(product, etf.upper()), 'csv', 'POST')
+               for etf, product in ISHARES_PRODUCTS.items()}
+    sources.update({ticker: Source(spdr_url.format(ticker), 'xlsx') for ticker in SPDR_TICKERS})
+    return sources
+
+
+def get_raw_file(etf, ext, raw_path=RAW_PATH):
+    return join(raw_path, etf, '{}.{}'.format(etf, ext))
+
+
+def make_session(retries=3, backoff=0.5, pool_size=16):
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=['GET', 'POST'])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def check_content(content, ext):
+    # Error pages come back as html with a 200, so the payload is checked
+    if ext == 'xlsx':
+        return content[:2] == b'PK'
+    head = content[:512].lstrip().lower()
+    return len(content) > 0 and not head.startswith((b'<!doctype', b'<html'))
+
+
+def write_file(content, fname):
+    fdir = os.path.dirname(fname)
+    if not os.path.isdir(fdir):
+        os.makedirs(fdir)
+    with open(fname + '.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(fname + '.tmp', fname)
+
+
+def download_file(session, source, fname, timeout=60):
+    resp = session.request(source.method, source.url, timeout=timeout)
+    resp.raise_for_status()
+    if not check_content(resp.content, source.ext):
+        raise ValueError('Unexpected content from {}'.format(source.url))
+    write_file(resp.content, fname)
+    return fname
+
+
+def find_new_download(download_dir, seen):
+    # Chrome names the file from Content-Disposition, so the new file is
+    # found by elimination, once it is no longer being written
+    names = set(os.listdir(download_dir)) - seen
+    if any(name.endswith(('.crdownload', '.tmp')) for name in names):
+        return None
+    return max(names, key=lambda name: os.path.getmtime(join(download_dir, name)), default=None)
+
+
+def browser_download(sources, fnames, timeout=60):
+    """
+    Fetches the given sources with one headless Chrome, using a private
+    download directory so each file can be picked up as the one completed
+    file that appeared after its request, and moved to its path. Returns
+    the etfs that were fetched.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    download_dir = tempfile.mkdtemp()
+    options = Options()
+    options.add_argument('--headless=new')
+    options.add_experimental_option('prefs', {'download.default_directory': download_dir,
+                                              'download.prompt_for_download': False})
+    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+    fetched = []
+    try:
+        for etf, source in sources.items():
+            seen = set(os.listdir(download_dir))
+            driver.get(source.url)
+            start = perf_counter()
+            name = find_new_download(download_dir, seen)
+            while name is None and perf_counter() - start < timeout:
+                sleep(0.2)
+                name = find_new_download(download_dir, seen)
+            if name is not None:
+                with open(join(download_dir, name), 'rb') as f:
+                    content = f.read()
+                if check_content(content, source.ext):
+                    write_file(content, fnames[etf])
+                    fetched.append(etf)
+                    continue
+            logging.warning('Browser download failed for {}'.format(etf))
+    finally:
+        driver.quit()
+        shutil.rmtree(download_dir, ignore_errors=True)
+    return fetched
+
+
+def download_holdings(sources=None, raw_path=RAW_PATH, max_workers=8, session=None,
+                      browser_fallback=True):
+    """
+    Downloads every source concurrently and returns etf -> file path for the
+    files that were fetched. Sources that fail after the session's retries
+    are tried once more through the browser when browser_fallback is set.
+    """
+    if sources is None:
+        sources = get_sources()
+    if session is None:
+        session = make_session(pool_size=max_workers)
+    fnames = {etf: get_raw_file(etf, source.ext, raw_path) for etf, source in sources.items()}
+
+    def fetch(etf):
+        try:
+            return etf, download_file(session, sources[etf], fnames[etf]), None
+        except (requests.RequestException, ValueError) as e:
+            return etf, None, e
+
+    paths = {}
+    failed = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for etf, fname, error in executor.map(fetch, sources):
+            if error is None:
+                logging.info('Downloaded holdings for {}'.format(etf))
+                paths[etf] = fname
+            else:
+                logging.warning('Download failed for {}: {}'.format(etf, error))
+                failed[etf] = sources[etf]
+    if failed and browser_fallback:
+        for etf in browser_download(failed, fnames):
+            paths[etf] = fnames[etf]
+    return paths
@@ -0,0 +1,154 @@
+"""
+Parsers for the raw iShares csv and SPDR xlsx holdings files. The preamble is
+scanned once for the holdings date and the header row, and the body goes
+straight into a typed DataFrame, with market values, weights and share
+counts parsed as numbers on the way in. xlsx files are streamed with
+openpyxl's read-only reader.
+"""
+
+import csv
+from datetime import datetime
+import io
+from time import perf_counter
+import openpyxl
+import pandas as pd
+
+ISHARES_NUMERIC = ['market value', 'weight (%)', 'notional value', 'shares', 'price', 'fx rate']
+SPDR_COLUMNS = 8
+SPDR_NUMERIC = ['weight', 'shares held']
+
+
+def to_number(series):
+    # Files saved before parsing was typed hold numbers as '1,234.5' strings
+    if series.dtype == object:
+        return pd.to_numeric(series.str.replace(',', ''), errors='coerce')
+    return series
+
+
+def find_ishares_layout(lines):
+    """
+    Returns (holdings date, header line, number of body lines). The body
+    ends at the first blank line, which separates it from the disclaimer.
+    Raises ValueError when the header or the holdings date is missing.
+    """
+    hdate = None
+    for i, line in enumerate(lines):
+        if hdate is None and 'as of' in line.lower():
+            row = next(csv.reader([line]))
+            hdate = datetime.strptime(row[1].strip(), '%b %d, %Y').strftime('%Y-%m-%d')
+        elif line.startswith('Ticker,'):
+            header = i
+            break
+    else:
+        raise ValueError('No header row in holdings file')
+    if hdate is None:
+        raise ValueError('No holdings date before the header row')
+    end = header + 1
+    while end < len(lines) and lines[end].strip('\xa0 \t"') != '':
+        end += 1
+    return hdate, header, end - header - 1
+
+
+def parse_ishares_csv(content):
+    """
+    Parses iShares holdings csv bytes into (holdings date, DataFrame) with
+    lower case column names and numeric columns already typed.
+    """
+    text = content.decode('utf-8-sig')
+    lines = text.splitlines()
+    hdate, header, nrows = find_ishares_layout(lines)
+    df = pd.read_csv(io.StringIO(text), skiprows=header, nrows=nrows, thousands=',',
+                     keep_default_na=False, na_values=['', '-'], dtype={'Ticker': str})
+    df.columns = df.columns.str.lower()
+    for col in ISHARES_NUMERIC:
+        if col in df:
+            df[col] = to_number(df[col])
+    return hdate, df
+
+
+def parse_spdr_xlsx(fname):
+    """
+    Streams a SPDR holdings xlsx into (holdings date, DataFrame). The date is
+    the 'As of' cell in the preamble, the header is the first row starting
+    with 'Name', and only complete rows of the first eight columns are kept.
+    """
+    wb = openpyxl.load_workbook(fname, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        hdate = None
+        for row in rows:
+            cells = row[:SPDR_COLUMNS]
+            if hdate is None and isinstance(cells[1], str) and cells[1].startswith('As of'):
+                hdate = datetime.strptime(cells[1].replace('As of ', ''), '%d-%b-%Y').strftime('%Y-%m-%d')
+            elif cells[0] == 'Name':
+                columns = [str(c).lower() for c in cells]
+                break
+        else:
+            raise ValueError('No header row in {}'.format(fname))
+        if hdate is None:
+            raise ValueError('No holdings date in {}'.format(fname))
+        body = []
+        for row in rows:
+            cells = row[:SPDR_COLUMNS]
+            if all(c is None for c in cells):
+                break
+            if all(c is not None for c in cells):
+                body.append(cells)
+    finally:
+        wb.close()
+    df = pd.DataFrame(body, columns=columns)
+    for col in SPDR_NUMERIC:
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return hdate, df
+
+
+def legacy_parse_ishares_csv(content):
+    # Previous row by row parse, kept for benchmarking
+    str_file = io.StringIO(content.decode('utf-8'), newline='\n')
+    data_array = [row for row in csv.reader(str_file)]
+    etf = pd.DataFrame(data_array)
+    hdate = datetime.strptime(etf.iloc[1, 1], '%b %d, %Y').strftime('%Y-%m-%d')
+    etf = etf.dropna().reset_index(drop=True)
+    etf.columns = etf.iloc[0, :]
+    etf = etf[1:]
+    etf.columns = etf.columns.str.lower()
+    etf['market value'] = etf['market value'].str.replace(',', '').astype(float)
+    return hdate, etf
+
+
+def legacy_parse_spdr_xlsx(fname):
+    df = pd.read_excel(fname)
+    hdate = datetime.strptime(df.iloc[1, 1].replace('As of ', ''), '%d-%b-%Y').strftime('%Y-%m-%d')
+    df = df.iloc[3:, :8]
+    df.columns = df.iloc[0, :]
+    df = df[1:].dropna()
+    df.columns = df.columns.str.lower()
+    df['weight'] = df['weight'].astype(float)
+    return hdate, df
+
+
+def benchmark_parsers(ishares_file, spdr_file=None, n_runs=5):
+    """
+    Times the legacy and streaming parsers on real files (the IWV csv is the
+    largest) and checks that they find the same rows.
+    """
+    def run(parser, arg):
+        times = []
+        for _ in range(n_runs):
+            start = perf_counter()
+            out = parser(arg)
+            times.append(perf_counter() - start)
+        return out, min(times)
+
+    with open(ishares_file, 'rb') as f:
+        content = f.read()
+    results = {}
+    (_, old), results['ishares legacy'] = run(legacy_parse_ishares_csv, content)
+    (_, new), results['ishares streaming'] = run(parse_ishares_csv, content)
+    assert len(old) == len(new), 'iShares parsers disagree on row count'
+    if spdr_file is not None:
+        (_, old), results['spdr read_excel'] = run(legacy_parse_spdr_xlsx, spdr_file)
+        (_, new), results['spdr read-only'] = run(parse_spdr_xlsx, spdr_file)
+        assert len(old) == len(new), 'SPDR parsers disagree on row count'
+    return pd.Series(results, name='seconds')
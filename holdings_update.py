@@ -0,0 +1,165 @@
+"""
+Incremental update of the constituents store from the daily holdings files.
+A manifest records each source file's size, mtime, content hash and holdings
+date per ETF, so unchanged files are skipped from a stat call alone. Every new
+or changed file is processed, not only the newest one, so missed days are
+backfilled in the same pass. ETFs with work to do are processed in parallel.
+The wide <etf>_constits.csv read by the zipline backtests is re-exported from
+the store after each update until those loaders read the store directly.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import logging
+import os
+from os.path import join, basename, splitext
+from pathlib import Path
+import pandas as pd
+from holdings_parsers import to_number
+from constituents_store import (FUNDAMENTALS_PATH, STORE_PATH, get_dates, write_partitions, migrate_wide_csv,
+                                export_wide_csv)
+
+CONSTITUENTS_PATH = join(Path.home(), '.zipline', 'custom_data', 'constituents')
+MANIFEST_FILE = '_manifest.json'
+
+
+def update_ishares_holdings(df, fdate):
+    df.dropna(subset=['permaticker'], inplace=True)
+    df['market value'] = to_number(df['market value'])
+    df['weight'] = df['market value'] / df['market value'].sum()
+    df.set_index('permaticker', drop=True, inplace=True)
+    df = df[['weight']].T
+    df.index = [pd.to_datetime(fdate)]
+    df.columns.name = None
+    return df
+
+
+def update_spdr_holdings(df, fdate):
+    df.dropna(subset=['permaticker'], inplace=True)
+    df['weight'] = to_number(df['weight'])
+    df['weight_adj'] = df.weight / df.weight.sum()
+    df.set_index('permaticker', drop=True, inplace=True)
+    df = df[['weight_adj']].T
+    df.index = [pd.to_datetime(fdate)]
+    df.columns.name = None
+    return df
+
+
+def get_file_date(fname):
+    # Daily files are saved as <etf>_<YYYY-MM-DD>.csv
+    return splitext(basename(fname))[0].rsplit('_', 1)[1]
+
+
+def get_file_hash(fname):
+    digest = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(store_path=STORE_PATH):
+    fname = join(store_path, MANIFEST_FILE)
+    if not os.path.isfile(fname):
+        return {}
+    with open(fname) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, store_path=STORE_PATH):
+    if not os.path.isdir(store_path):
+        os.makedirs(store_path)
+    fname = join(store_path, MANIFEST_FILE)
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(fname + '.tmp', fname)
+
+
+def get_weights(fname, fdate):
+    df = pd.read_csv(fname, index_col=0)
+    if 'market value' in list(df.columns):
+        df_out = update_ishares_holdings(df, fdate)
+    else:
+        df_out = update_spdr_holdings(df, fdate)
+    return df_out.iloc[0]
+
+
+def find_changed_files(epath, entries, stored_dates):
+    """
+    Returns [(file name, date, size, mtime)] for files that are new, whose
+    size or mtime differs from the manifest, or whose date is missing from
+    the store. Nothing is opened here.
+    """
+    changed = []
+    for name in sorted(os.listdir(epath)):
+        if not name.endswith('.csv'):
+            continue
+        stat = os.stat(join(epath, name))
+        entry = entries.get(name)
+        fdate = get_file_date(name)
+        if (entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns
+                or fdate not in stored_dates):
+            changed.append((name, fdate, stat.st_size, stat.st_mtime_ns))
+    return changed
+
+
+def process_etf(task):
+    """
+    Worker for one ETF. Files whose hash matches the manifest and whose date
+    is already stored only get their stat refreshed. The rest are converted
+    to weights and written in one batch, and the wide csv is exported again.
+    Returns (etf, updated manifest entries).
+    """
+    etf, epath, changed, entries, store_path, wide_csv = task
+    if os.path.isfile(wide_csv) and not get_dates(etf, store_path):
+        migrate_wide_csv(etf, wide_csv, store_path)
+    stored = set(get_dates(etf, store_path))
+    updated = {}
+    weights_by_date = {}
+    for name, fdate, size, mtime in changed:
+        fname = join(epath, name)
+        file_hash = get_file_hash(fname)
+        entry = entries.get(name)
+        if entry is None or entry['hash'] != file_hash or fdate not in stored:
+            weights_by_date[fdate] = get_weights(fname, fdate)
+        updated[name] = {'date': fdate, 'size': size, 'mtime': mtime, 'hash': file_hash}
+    if weights_by_date:
+        logging.info('Updating holdings for {} ({} dates)'.format(etf, len(weights_by_date)))
+        write_partitions(etf, weights_by_date, store_path)
+        export_wide_csv(etf, wide_csv, store_path)
+    return etf, updated
+
+
+def update_holdings(cpath=CONSTITUENTS_PATH, store_path=STORE_PATH, fundamentals_path=FUNDAMENTALS_PATH,
+                    max_workers=None):
+    """
+    Brings the store up to date with every daily file under cpath and
+    returns the number of files processed per ETF. On first sight of an ETF
+    its legacy <etf>_constits.csv, if any, is migrated before the new files,
+    and the csv is rewritten from the store whenever new weights land.
+    """
+    manifest = load_manifest(store_path)
+    tasks = []
+    for etf in sorted(os.listdir(cpath)):
+        epath = join(cpath, etf)
+        if '.py' in etf or not os.path.isdir(epath):
+            continue
+        entries = manifest.get(etf, {}).get('files', {})
+        changed = find_changed_files(epath, entries, set(get_dates(etf, store_path)))
+        if not changed:
+            continue
+        tasks.append((etf, epath, changed, entries, store_path,
+                      join(fundamentals_path, etf + '_constits.csv')))
+
+    counts = {}
+    if tasks:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for etf, updated in executor.map(process_etf, tasks):
+                etf_manifest = manifest.setdefault(etf, {'files': {}})
+                etf_manifest['files'].update(updated)
+                etf_manifest['last_date'] = max(entry['date'] for entry in etf_manifest['files'].values())
+                counts[etf] = len(updated)
+        save_manifest(manifest, store_path)
+    logging.info('Holdings updated for {} ETFs'.format(len(counts)))
+    return counts
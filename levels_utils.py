@@ -0,0 +1,236 @@
+"""
+Incremental technical levels (SMAs and 20 day volatility bands) from daily
+bars. Bars are kept on disk per symbol and only the days since the last stored
+bar are requested. Levels for all symbols live in one RollingLevels object
+that holds running sums and sums of squares in a ring buffer, so each new bar
+is an O(1) update, vectorized across symbols.
+"""
+
+from datetime import date, datetime
+import os
+from os.path import join
+import numpy as np
+import pandas as pd
+
+BAR_PATH = join('Portfolio', 'bars')
+STATE_FILE = 'levels_state.npz'
+WINDOWS = (20, 50, 100, 200)
+STD_WINDOW = 20
+BAND_MULTS = {'10': 1.0, '15': 1.5, '23': 2.3}
+BAR_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+LEVEL_COLUMNS = (['close'] + ['SMA{}'.format(w) for w in WINDOWS]
+                 + ['upper{}_{}'.format(STD_WINDOW, k) for k in BAND_MULTS]
+                 + ['lower{}_{}'.format(STD_WINDOW, k) for k in BAND_MULTS]
+                 + ['ylow', 'yhigh'])
+
+
+def read_bars(symbol, bar_path=BAR_PATH):
+    fname = join(bar_path, '{}.csv'.format(symbol))
+    if not os.path.isfile(fname):
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    return pd.read_csv(fname, parse_dates=['date'])
+
+
+def write_bars(symbol, bars, bar_path=BAR_PATH):
+    if not os.path.isdir(bar_path):
+        os.makedirs(bar_path)
+    fname = join(bar_path, '{}.csv'.format(symbol))
+    bars.to_csv(fname + '.tmp', index=False)
+    os.replace(fname + '.tmp', fname)
+
+
+def fetch_daily_bars(ib, contract, duration):
+    bars = ib.reqHistoricalData(contract,
+                                datetime.now(),
+                                durationStr=duration,
+                                whatToShow='TRADES',
+                                barSizeSetting='1 day',
+                                useRTH=False)
+    df = pd.DataFrame(bars)
+    if df.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    df['date'] = pd.to_datetime(df['date'])
+    return df[BAR_COLUMNS]
+
+
+def update_bars(ib, contracts, bar_path=BAR_PATH, drop_last=False):
+    """
+    Brings the stored bars for each symbol in contracts (symbol -> qualified
+    contract) up to date and returns symbol -> (all bars, new bars). The last
+    stored bar is requested again and replaces the stored one, in case it was
+    taken before the close. drop_last removes today's bar while it is still
+    forming. Requests are sequential, as IB calls stay on the main thread.
+    """
+    out = {}
+    for symbol, contract in contracts.items():
+        bars = read_bars(symbol, bar_path)
+        if bars.empty:
+            duration = '1 Y'
+        else:
+            last = bars['date'].iloc[-1].date()
+            duration = '{} D'.format(max((date.today() - last).days + 1, 2))
+        new = fetch_daily_bars(ib, contract, duration)
+        if drop_last and len(new) and new['date'].iloc[-1].date() == date.today():
+            new = new.iloc[:-1]
+        if len(bars):
+            new = new[new['date'] >= bars['date'].iloc[-1]]
+            bars = bars[bars['date'] < new['date'].min()] if len(new) else bars
+        bars = pd.concat([bars, new], ignore_index=True)
+        write_bars(symbol, bars, bar_path)
+        out[symbol] = (bars, new)
+    return out
+
+
+class RollingLevels:
+    """
+    Running window sums for a fixed list of symbols. The ring buffer holds the
+    last max(WINDOWS) closes per symbol, so the value leaving each window is
+    always at hand. Each symbol keeps its own bar count, as calendars differ
+    between instruments.
+    """
+
+    def __init__(self, symbols, windows=WINDOWS, std_window=STD_WINDOW):
+        self.symbols = list(symbols)
+        self.windows = tuple(windows)
+        self.std_window = std_window
+        self.size = max(self.windows + (std_window,))
+        n = len(self.symbols)
+        self.buffer = np.zeros((self.size, n))
+        self.count = np.zeros(n, dtype=np.int64)
+        self.sums = np.zeros((len(self.windows), n))
+        self.std_sum = np.zeros(n)
+        self.std_sumsq = np.zeros(n)
+        self.high = np.full(n, np.nan)
+        self.low = np.full(n, np.nan)
+        self.last_date = np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]')
+        self.col = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    def window_sum_delta(self, cols, close, w, replace):
+        count = self.count[cols]
+        if replace:
+            # The bar being replaced sits at count - 1 and is in every window
+            return close - self.buffer[(count - 1) % self.size, cols]
+        old = np.where(count >= w, self.buffer[(count - w) % self.size, cols], 0.0)
+        return close - old
+
+    def update(self, symbols, close, high, low, dates, replace=False):
+        """
+        Adds one bar for each of symbols. With replace the bar overwrites the
+        latest bar of that symbol instead, for restated or completed bars.
+        """
+        cols = np.array([self.col[s] for s in symbols], dtype=np.int64)
+        close = np.asarray(close, dtype=float)
+        for k, w in enumerate(self.windows):
+            self.sums[k, cols] += self.window_sum_delta(cols, close, w, replace)
+        count = self.count[cols]
+        if replace:
+            old = self.buffer[(count - 1) % self.size, cols]
+            self.std_sum[cols] += close - old
+            self.std_sumsq[cols] += close ** 2 - old ** 2
+            self.buffer[(count - 1) % self.size, cols] = close
+        else:
+            old = np.where(count >= self.std_window,
+                           self.buffer[(count - self.std_window) % self.size, cols], 0.0)
+            self.std_sum[cols] += close - old
+            self.std_sumsq[cols] += close ** 2 - old ** 2
+            self.buffer[count % self.size, cols] = close
+            self.count[cols] += 1
+        self.high[cols] = high
+        self.low[cols] = low
+        self.last_date[cols] = pd.to_datetime(dates).values
+
+    def add_bars(self, symbol, bars):
+        # Feeds a frame of bars oldest first, replacing the latest bar when dates match
+        i = self.col[symbol]
+        for row in bars.itertuples(index=False):
+            replace = self.count[i] > 0 and pd.Timestamp(row.date).to_datetime64() == self.last_date[i]
+            self.update([symbol], [row.close], [row.high], [row.low], [row.date], replace=replace)
+
+    def resync(self):
+        # Recomputes the sums from the buffer to clear accumulated rounding error
+        for i in range(len(self.symbols)):
+            count = self.count[i]
+            for k, w in enumerate(self.windows):
+                self.sums[k, i] = self.tail(i, min(count, w)).sum()
+            tail = self.tail(i, min(count, self.std_window))
+            self.std_sum[i] = tail.sum()
+            self.std_sumsq[i] = (tail ** 2).sum()
+
+    def tail(self, i, n):
+        idx = (self.count[i] - 1 - np.arange(n)) % self.size
+        return self.buffer[idx, i]
+
+    def levels(self):
+        idx = (self.count - 1) % self.size
+        close = np.where(self.count > 0, self.buffer[idx, np.arange(len(self.symbols))], np.nan)
+        levels = {'close': close}
+        for k, w in enumerate(self.windows):
+            levels['SMA{}'.format(w)] = np.where(self.count >= w, self.sums[k] / w, np.nan)
+        n = self.std_window
+        var = (self.std_sumsq - self.std_sum ** 2 / n) / (n - 1)
+        std = np.where(self.count >= n, np.sqrt(np.maximum(var, 0.0)), np.nan)
+        mean = np.where(self.count >= n, self.std_sum / n, np.nan)
+        for key, mult in BAND_MULTS.items():
+            levels['upper{}_{}'.format(n, key)] = mean + std * mult
+        for key, mult in BAND_MULTS.items():
+            levels['lower{}_{}'.format(n, key)] = mean - std * mult
+        levels['ylow'] = self.low
+        levels['yhigh'] = self.high
+        return pd.DataFrame(levels, index=pd.Index(self.symbols, name='symbol'))
+
+    def save(self, fname):
+        self.resync()
+        np.savez(fname, symbols=np.array(self.symbols), windows=np.array(self.windows),
+                 std_window=self.std_window, buffer=self.buffer, count=self.count, sums=self.sums,
+                 std_sum=self.std_sum, std_sumsq=self.std_sumsq, high=self.high, low=self.low,
+                 last_date=self.last_date)
+
+    @classmethod
+    def load(cls, fname):
+        data = np.load(fname)
+        obj = cls(data['symbols'].tolist(), data['windows'].tolist(), int(data['std_window']))
+        for name in ['buffer', 'count', 'sums', 'std_sum', 'std_sumsq', 'high', 'low', 'last_date']:
+            setattr(obj, name, data[name])
+        return obj
+
+    @classmethod
+    def from_bars(cls, bars_by_symbol, windows=WINDOWS, std_window=STD_WINDOW):
+        # Only the last max(windows) bars of each history are needed
+        obj = cls(list(bars_by_symbol), windows, std_window)
+        for symbol, bars in bars_by_symbol.items():
+            obj.add_bars(symbol, bars.iloc[-obj.size:])
+        obj.resync()
+        return obj
+
+
+def load_levels_state(bars_by_symbol, bar_path=BAR_PATH):
+    # The saved state is only reused when it covers the same symbols
+
+    fname = join(bar_path, STATE_FILE)
+    if os.path.isfile(fname):
+        state = RollingLevels.load(fname)
+        if state.symbols == list(bars_by_symbol):
+            return state
+    return None
+
+
+def update_levels(ib, contracts, bar_path=BAR_PATH, drop_last=False):
+    """
+    Updates the stored bars for contracts (symbol -> contract) and returns
+    the current levels as a DataFrame indexed by symbol. Only the new bars
+    are applied to the saved rolling state.
+    """
+    updates = update_bars(ib, contracts, bar_path, drop_last)
+    state = load_levels_state({s: bars for s, (bars, new) in updates.items()}, bar_path)
+    if state is None:
+        state = RollingLevels.from_bars({s: bars for s, (bars, new) in updates.items()})
+    else:
+        for symbol, (bars, new) in updates.items():
+            i = state.col[symbol]
+            if state.count[i] and not pd.isnull(state.last_date[i]):
+                new = bars[bars['date'] >= state.last_date[i]]
+            else:
+                new = bars
+            state.add_bars(symbol, new)
+    state.save(join(bar_path, STATE_FILE))
+    return state.levels()
@@ -3,7 +3,9 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 from statsmodels.stats.moment_helpers import corr2cov
-import scipy.linalg
+from mc_utils import simulate_returns, run_streaming_simulation, run_parallel_simulation
+from mc_generators import (NormalGenerator, StudentTGenerator, BootstrapGenerator,
+                           RegimeSwitchingGenerator, benchmark_generators)
 
 # Read in data
 file_path = join(Path.home(), 'documents')
@@ -55,11 +57,39 @@ mu_m = (1+mu)**(1/12) - 1
 sigma_m = sigma / np.sqrt(12)
 cov_m = cov / 12
 
-# Calculate correlated rets for 1 period
-L = scipy.linalg.lu(corr)[1]
-Z = np.random.normal(scale=sigma, size=len(sigma)) # assumes normality here
-cor_var = np.inner(L, Z)
-rets = mu + cor_var
-print(pd.DataFrame(data={'rets': rets, 'mu': mu, 'sigma': sigma}, index=rr.index))
+# Simulation runs are kept behind a main guard so spawned pool workers can
+# re-import this script without re-running them
+if __name__ == '__main__':
+    # Calculate correlated rets for 1 period
+    seed = 42
+    rets = simulate_returns(NormalGenerator(mu, cov), n_paths=1, n_periods=1, seed=seed)[0, 0]
+    print(pd.DataFrame(data={'rets': rets, 'mu': mu, 'sigma': sigma}, index=rr.index))
 
+    # Simulate 30 years of monthly wealth paths for an equal weight portfolio and
+    # check the streaming percentile sketches against the materialized paths
+    weights = np.full(len(mu), 1 / len(mu))
+    normal_m = NormalGenerator(mu_m, cov_m)
+    acc = run_streaming_simulation(normal_m, weights, n_paths=10000, n_periods=360,
+                                   asset_names=rr.index, exact=True, seed=seed)
+    print(acc.sketch_error())
 
+    # Fat tailed and calm/crisis regime generators. The crisis regime doubles vols
+    # and pulls correlations halfway towards one.
+    cov_crisis_m = corr2cov(0.5 * corr + 0.5, sigma_m * 2)
+    generators = {
+        'normal': normal_m,
+        'student_t': StudentTGenerator(mu_m, cov_m, dof=5),
+        'bootstrap': BootstrapGenerator(normal_m.draw(np.random.default_rng(seed), 1, 240)[0]),
+        'regime': RegimeSwitchingGenerator([mu_m, mu_m], [cov_m, cov_crisis_m],
+                                           transition=[[0.98, 0.02], [0.10, 0.90]]),
+        }
+    print(benchmark_generators(generators, seed=seed))
+
+    # Run the full study sharded across all cores
+    acc = run_parallel_simulation(normal_m, weights, n_paths=1000000, n_periods=360,
+                                  asset_names=rr.index, seed=seed)
+    results = acc.summary()
+    print(results['asset_summary'])
+    print(pd.DataFrame({'terminal_wealth': results['terminal_wealth'],
+                        'max_drawdown': results['max_drawdown']}))
+    print('Probability of shortfall: {:.2%}'.format(results['prob_shortfall']))
@@ -0,0 +1,210 @@
+"""
+Streaming accumulators for Monte Carlo output. Path chunks are folded into
+running moments and fixed-grid quantile sketches as they are generated, so
+memory scales with the number of periods rather than the number of paths.
+"""
+
+import numpy as np
+import pandas as pd
+
+PERCENTILES = [5, 10, 25, 50, 75, 90, 95]
+
+
+def max_drawdown(wealth, initial_wealth=1.0):
+    peaks = np.maximum(np.maximum.accumulate(wealth, axis=-1), initial_wealth)
+    return (1 - wealth / peaks).max(axis=-1)
+
+
+class RunningMoments:
+    """Welford mean/variance, updated a batch at a time along the first axis."""
+
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, x):
+        if len(x) == 0:
+            return
+        batch_mean = x.mean(axis=0)
+        batch_m2 = ((x - batch_mean)**2).sum(axis=0)
+        self._combine(len(x), batch_mean, batch_m2)
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+
+    def _combine(self, n, mean, m2):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + m2 + delta**2 * self.count * n / total
+        self.count = total
+
+    @property
+    def var(self):
+        return self.m2 / max(self.count - 1, 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+class QuantileSketch:
+    """
+    Fixed-grid histogram per cell with linear interpolation inside bins. Values
+    outside [lo, hi] land in the edge bins, and the exact min/max are tracked
+    so the tails are still bounded correctly.
+    """
+
+    def __init__(self, n_cells, lo, hi, n_bins=2000, log=False):
+        self.log = log
+        self.edges = np.linspace(self._transform(lo), self._transform(hi), n_bins + 1)
+        self.counts = np.zeros((n_cells, n_bins), dtype=np.int64)
+        self.count = 0
+        self.min = np.full(n_cells, np.inf)
+        self.max = np.full(n_cells, -np.inf)
+
+    def _transform(self, x):
+        if self.log:
+            return np.log(np.maximum(x, np.finfo(float).tiny))
+        return np.asarray(x, dtype=float)
+
+    def _inverse(self, x):
+        return np.exp(x) if self.log else x
+
+    def update(self, x):
+        n_cells, n_bins = self.counts.shape
+        t = self._transform(x.reshape(len(x), n_cells))
+        width = self.edges[1] - self.edges[0]
+        idx = np.clip(np.floor((t - self.edges[0]) / width), 0, n_bins - 1).astype(np.int64)
+        idx += np.arange(n_cells) * n_bins
+        self.counts += np.bincount(idx.ravel(), minlength=n_cells * n_bins).reshape(n_cells, n_bins)
+        self.count += len(x)
+        self.min = np.minimum(self.min, t.min(axis=0))
+        self.max = np.maximum(self.max, t.max(axis=0))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.count += other.count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    def quantile(self, q):
+        n_cells, n_bins = self.counts.shape
+        rows = np.arange(n_cells)
+        cum = np.cumsum(self.counts, axis=1)
+        target = q * self.count
+        idx = np.minimum((cum < target).sum(axis=1), n_bins - 1)
+        in_bin = self.counts[rows, idx]
+        below = cum[rows, idx] - in_bin
+        frac = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1), 0.0)
+        lower = np.where(idx == 0, np.minimum(self.edges[0], self.min), self.edges[idx])
+        upper = np.where(idx == n_bins - 1, np.maximum(self.edges[-1], self.max), self.edges[idx + 1])
+        t = lower + np.clip(frac, 0, 1) * (upper - lower)
+        return self._inverse(np.clip(t, self.min, self.max))
+
+
+class SimulationAccumulator:
+    """
+    Consumes (returns, wealth) path chunks and keeps only O(periods) state.
+    With exact=True the wealth paths and drawdowns are also materialized so
+    sketch error can be checked against exact percentiles on small runs.
+    """
+
+    def __init__(self, n_periods, asset_names, initial_wealth=1.0, shortfall_wealth=None,
+                 percentiles=PERCENTILES, exact=False, wealth_range=(1e-3, 1e3),
+                 wealth_bins=2000, drawdown_bins=1000):
+        self.asset_names = list(asset_names)
+        self.initial_wealth = initial_wealth
+        self.shortfall_wealth = initial_wealth if shortfall_wealth is None else shortfall_wealth
+        self.percentiles = list(percentiles)
+        self.exact = exact
+        self.asset_moments = RunningMoments(len(self.asset_names))
+        self.wealth_moments = RunningMoments(n_periods)
+        self.shortfall_counts = np.zeros(n_periods, dtype=np.int64)
+        self.wealth_sketch = QuantileSketch(n_periods,
+                                            wealth_range[0] * initial_wealth,
+                                            wealth_range[1] * initial_wealth,
+                                            wealth_bins, log=True)
+        self.drawdown_sketch = QuantileSketch(1, 0.0, 1.0, drawdown_bins)
+        self.wealth_paths = []
+        self.drawdowns = []
+
+    @property
+    def n_paths(self):
+        return self.wealth_moments.count
+
+    @property
+    def n_periods(self):
+        return len(self.shortfall_counts)
+
+    def update(self, rets, wealth):
+        drawdowns = max_drawdown(wealth, self.initial_wealth)
+        self.asset_moments.update(rets.reshape(-1, rets.shape[-1]))
+        self.wealth_moments.update(wealth)
+        self.shortfall_counts += (wealth < self.shortfall_wealth).sum(axis=0)
+        self.wealth_sketch.update(wealth)
+        self.drawdown_sketch.update(drawdowns)
+        if self.exact:
+            self.wealth_paths.append(wealth.copy())
+            self.drawdowns.append(drawdowns)
+
+    def merge(self, other):
+        self.asset_moments.merge(other.asset_moments)
+        self.wealth_moments.merge(other.wealth_moments)
+        self.shortfall_counts += other.shortfall_counts
+        self.wealth_sketch.merge(other.wealth_sketch)
+        self.drawdown_sketch.merge(other.drawdown_sketch)
+        self.wealth_paths.extend(other.wealth_paths)
+        self.drawdowns.extend(other.drawdowns)
+
+    def _use_exact(self, exact):
+        exact = self.exact if exact is None else exact
+        if exact and not self.exact:
+            raise ValueError('Exact percentiles require an accumulator built with exact=True')
+        return exact
+
+    def fan_chart(self, exact=None):
+        if self._use_exact(exact):
+            bands = np.percentile(np.concatenate(self.wealth_paths), self.percentiles, axis=0)
+        else:
+            bands = np.array([self.wealth_sketch.quantile(p / 100) for p in self.percentiles])
+        fan = pd.DataFrame(bands.T, index=pd.RangeIndex(1, self.n_periods + 1, name='period'),
+                           columns=self.percentiles)
+        fan['mean'] = self.wealth_moments.mean
+        return fan
+
+    def drawdown_percentiles(self, exact=None):
+        if self._use_exact(exact):
+            values = np.percentile(np.concatenate(self.drawdowns), self.percentiles)
+        else:
+            values = [self.drawdown_sketch.quantile(p / 100)[0] for p in self.percentiles]
+        return pd.Series(values, index=self.percentiles)
+
+    def asset_summary(self):
+        return pd.DataFrame(data={'mean': self.asset_moments.mean,
+                                  'stdev': self.asset_moments.std},
+                            index=self.asset_names)
+
+    def summary(self, exact=None):
+        fan = self.fan_chart(exact)
+        shortfall = pd.Series(self.shortfall_counts / self.n_paths, index=fan.index)
+        summary = {
+            'terminal_wealth': fan[self.percentiles].iloc[-1].rename(None),
+            'max_drawdown': self.drawdown_percentiles(exact),
+            'prob_shortfall': shortfall.iloc[-1],
+            'shortfall_by_period': shortfall,
+            'fan_chart': fan,
+            'asset_summary': self.asset_summary(),
+            }
+        return summary
+
+    def sketch_error(self):
+        sketch_fan = self.fan_chart(exact=False)[self.percentiles]
+        exact_fan = self.fan_chart(exact=True)[self.percentiles]
+        return pd.DataFrame(data={
+            'wealth_max_rel_err': (sketch_fan / exact_fan - 1).abs().max(),
+            'drawdown_abs_err': (self.drawdown_percentiles(exact=False)
+                                 - self.drawdown_percentiles(exact=True)).abs(),
+            })
@@ -0,0 +1,114 @@
+"""
+Vectorized Monte Carlo engine for simulating asset class returns from a pluggable
+generator (see mc_generators) and compounding them into portfolio wealth paths.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+from mc_stats import SimulationAccumulator, PERCENTILES
+
+# Upper bound on the size of a single paths x periods x assets return block
+CHUNK_BYTES = 256 * 2**20
+
+# Paths per seeded block and per parallel shard. Each block gets its own
+# spawned seed and shards always hold the same blocks, so the results do not
+# depend on how many workers the shards are spread over.
+BLOCK_PATHS = 2000
+SHARD_PATHS = 20000
+
+
+def get_chunk_size(n_periods, n_assets, chunk_bytes=CHUNK_BYTES):
+    return max(1, int(chunk_bytes // (n_periods * n_assets * 8)))
+
+
+def simulate_returns(generator, n_paths, n_periods, seed=None):
+    rng = np.random.default_rng(seed)
+    return generator.draw(rng, n_paths, n_periods)
+
+
+def iter_return_chunks(generator, n_paths, n_periods, chunk_size=None, seed=None):
+    rng = np.random.default_rng(seed)
+    if chunk_size is None:
+        chunk_size = get_chunk_size(n_periods, generator.n_assets)
+    for start in range(0, n_paths, chunk_size):
+        size = min(chunk_size, n_paths - start)
+        yield generator.draw(rng, size, n_periods)
+
+
+def compound_wealth(rets, weights, initial_wealth=1.0):
+    # Weights are rebalanced back to target every period
+    port_rets = rets @ weights
+    return initial_wealth * np.cumprod(1 + port_rets, axis=-1)
+
+
+def simulate_wealth(generator, weights, n_paths, n_periods, initial_wealth=1.0,
+                    chunk_size=None, seed=None):
+    weights = np.asarray(weights, dtype=float)
+    wealth = np.empty((n_paths, n_periods))
+    start = 0
+    for rets in iter_return_chunks(generator, n_paths, n_periods, chunk_size, seed):
+        end = start + len(rets)
+        wealth[start:end] = compound_wealth(rets, weights, initial_wealth)
+        start = end
+    return wealth
+
+
+def simulate_shard(task):
+    generator, weights, n_periods, block_sizes, seed_seqs, acc_kwargs = task
+    acc = SimulationAccumulator(n_periods, **acc_kwargs)
+    for size, seed_seq in zip(block_sizes, seed_seqs):
+        rng = np.random.default_rng(seed_seq)
+        rets = generator.draw(rng, size, n_periods)
+        acc.update(rets, compound_wealth(rets, weights, acc.initial_wealth))
+    return acc
+
+
+def run_streaming_simulation(generator, weights, n_paths, n_periods, asset_names=None,
+                             initial_wealth=1.0, shortfall_wealth=None,
+                             percentiles=PERCENTILES, exact=False, chunk_size=None, seed=None):
+    weights = np.asarray(weights, dtype=float)
+    if asset_names is None:
+        asset_names = range(len(weights))
+    acc = SimulationAccumulator(n_periods, asset_names, initial_wealth, shortfall_wealth,
+                                percentiles, exact)
+    for rets in iter_return_chunks(generator, n_paths, n_periods, chunk_size, seed):
+        acc.update(rets, compound_wealth(rets, weights, initial_wealth))
+    return acc
+
+
+def run_parallel_simulation(generator, weights, n_paths, n_periods, asset_names=None,
+                            initial_wealth=1.0, shortfall_wealth=None,
+                            percentiles=PERCENTILES, exact=False, n_workers=None,
+                            block_paths=BLOCK_PATHS, shard_paths=SHARD_PATHS, seed=None):
+    weights = np.asarray(weights, dtype=float)
+    if asset_names is None:
+        asset_names = range(len(weights))
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    acc_kwargs = {'asset_names': list(asset_names),
+                  'initial_wealth': initial_wealth,
+                  'shortfall_wealth': shortfall_wealth,
+                  'percentiles': percentiles,
+                  'exact': exact}
+
+    # Split paths into fixed size blocks, each with an independent seed, and
+    # group consecutive blocks into shards that each return one accumulator
+    block_sizes = [min(block_paths, n_paths - start) for start in range(0, n_paths, block_paths)]
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(block_sizes))
+    shard_blocks = max(1, shard_paths // block_paths)
+    tasks = [(generator, weights, n_periods, block_sizes[i:i+shard_blocks],
+              seed_seqs[i:i+shard_blocks], acc_kwargs)
+             for i in range(0, len(block_sizes), shard_blocks)]
+
+    # Shards come back in submission order, whatever the worker count
+    if n_workers == 1:
+        results = list(map(simulate_shard, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(simulate_shard, tasks))
+
+    acc = results[0]
+    for shard_acc in results[1:]:
+        acc.merge(shard_acc)
+    return acc
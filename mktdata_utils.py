@@ -0,0 +1,75 @@
+"""
+Batched market data snapshots for IB positions. Contracts are qualified in one
+call and cached by conId across runs, every ticker is subscribed up front, and
+the wait ends as soon as each ticker has a price (and greeks for options)
+rather than after a fixed sleep.
+"""
+
+import os
+from os.path import join
+import pickle
+from time import perf_counter
+import numpy as np
+import pandas as pd
+from ib_insync import Contract
+
+CONTRACT_CACHE_PATH = join('Portfolio', 'qualified_contracts.pkl')
+OPTION_TYPES = ['OPT', 'FOP']
+
+# Qualified contracts by conId, loaded from disk on first use
+_contract_cache = {}
+
+
+def load_contract_cache(cache_path=CONTRACT_CACHE_PATH):
+    if not _contract_cache and os.path.isfile(cache_path):
+        with open(cache_path, 'rb') as f:
+            _contract_cache.update(pickle.load(f))
+    return _contract_cache
+
+
+def save_contract_cache(cache_path=CONTRACT_CACHE_PATH):
+    with open(cache_path, 'wb') as f:
+        pickle.dump(_contract_cache, f)
+
+
+def qualify_contracts(ib, contracts, cache_path=CONTRACT_CACHE_PATH):
+    cache = load_contract_cache(cache_path)
+    missing = [Contract(conId=c.conId) for c in contracts if c.conId not in cache]
+    if missing:
+        for qualified in ib.qualifyContracts(*missing):
+            cache[qualified.conId] = qualified
+        save_contract_cache(cache_path)
+    return [cache.get(c.conId, c) for c in contracts]
+
+
+def is_ticker_ready(ticker):
+    price = ticker.marketPrice()
+    if price is None or np.isnan(price):
+        return False
+    if ticker.contract.secType in OPTION_TYPES:
+        return ticker.askGreeks is not None
+    return True
+
+
+def snapshot_tickers(ib, contracts, timeout=10, poll=0.1, cache_path=CONTRACT_CACHE_PATH):
+    qualified = qualify_contracts(ib, contracts, cache_path)
+    tickers = [ib.reqMktData(contract) for contract in qualified]
+    start = perf_counter()
+    while perf_counter() - start < timeout and not all(is_ticker_ready(t) for t in tickers):
+        ib.sleep(poll)
+    return tickers
+
+
+def get_ticker_values(ticker):
+    # Stocks and futures have no greeks, so they get a delta of one and use
+    # their own price as the underlying price
+    price = ticker.marketPrice()
+    greeks = ticker.askGreeks
+    if greeks is None:
+        return price, greeks, 1, price
+    return price, greeks, greeks.delta, greeks.undPrice
+
+
+def get_ticker_fields(tickers):
+    rows = [(ticker,) + get_ticker_values(ticker) for ticker in tickers]
+    return pd.DataFrame(rows, columns=['mkt_data', 'price', 'greeks', 'delta', 'undprice'])
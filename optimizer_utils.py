@@ -0,0 +1,398 @@
+"""
+Efficient frontier engine for the long/short optimizer. The cvxpy problem is
+compiled once with gamma as a parameter, and every solve after the first is
+warm started from the previous solution. Nothing here imports matplotlib, so
+batch runs stay headless.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import cvxpy as cvx
+import numpy as np
+import pandas as pd
+from covariance_utils import as_cov, estimate_cov, portfolio_variance, to_full_cov
+
+GAMMA_VALS = np.logspace(-2, 3, num=100)
+
+# QP solvers in order of preference, SCS is the last resort
+QP_SOLVERS = ['CLARABEL', 'OSQP', 'SCS']
+
+
+def get_default_solver():
+    installed = cvx.installed_solvers()
+    for solver in QP_SOLVERS:
+        if solver in installed:
+            return solver
+
+
+class CvxSolver:
+    """Parametric cvxpy problem, solved one gamma at a time with warm starts."""
+
+    def __init__(self, mu, sigma, net=0.0, gross=1.0, bound=0.05, solver=None, warm_start=True):
+        self.solver = get_default_solver() if solver is None else solver
+        self.warm_start = warm_start
+        self.w = cvx.Variable(len(mu))
+        self.gamma = cvx.Parameter(nonneg=True)
+        ret = mu @ self.w
+        if isinstance(sigma, tuple):
+            F, d = sigma
+            risk = cvx.sum_squares(F.T @ self.w) + cvx.sum(cvx.multiply(d, cvx.square(self.w)))
+        else:
+            risk = cvx.quad_form(self.w, sigma)
+        objective = cvx.Maximize(ret - self.gamma*risk)
+        constraints = [cvx.sum(self.w) == net,
+                       cvx.norm(self.w, 1) <= gross,
+                       self.w >= -bound,
+                       self.w <= bound]
+        self.prob = cvx.Problem(objective, constraints)
+
+    def solve(self, gamma_val):
+        self.gamma.value = gamma_val
+        self.prob.solve(solver=self.solver, warm_start=self.warm_start)
+        return self.w.value.copy()
+
+
+class NativeSolver:
+    """
+    Primal active-set solver in pure NumPy for exactly this constraint
+    family: sum(w) == net, norm(w, 1) <= gross and |w| <= bound. Each weight
+    is either fixed at -bound, 0 or bound, or free on one side of zero, which
+    makes the L1 constraint linear, so every iteration is one small KKT solve
+    over the free weights. Consecutive gammas share most of their active set,
+    so each gamma after the first is warm started from the previous solution
+    and typically takes a handful of iterations. The result is exact up to
+    the linear solves. A gamma that hits max_iter is re-solved with cvxpy.
+    """
+
+    def __init__(self, mu, sigma, net=0.0, gross=1.0, bound=0.05, tol=1e-10, max_iter=None,
+                 fallback_solver=None):
+        if gross <= 0 or bound <= 0 or abs(net) > min(gross, len(mu) * bound):
+            raise ValueError('Infeasible constraints: net={}, gross={}, bound={}'.format(
+                net, gross, bound))
+        n = len(mu)
+        self.mu = mu
+        self.sigma = sigma
+        self.cov = to_full_cov(sigma)
+        self.constraints = {'net': net, 'gross': gross, 'bound': bound}
+        self.tol = tol
+        self.max_iter = 10*n + 100 if max_iter is None else max_iter
+        self.fallback_solver = fallback_solver
+        self.fallback = None
+        self.n_fallbacks = 0
+        self.n_iter = 0
+        self.w, self.state = self.initial_point()
+        self.l1_active = False
+
+    def initial_point(self):
+        # state is -2/2 at -bound/bound, 0 at zero and -1/1 free on that side
+        # of zero. The free weights have to be able to meet sum(w) == net.
+        n = len(self.mu)
+        net, bound = self.constraints['net'], self.constraints['bound']
+        k = int(abs(net) // bound)
+        w = np.zeros(n)
+        state = np.zeros(n, dtype=int)
+        sign = 1 if net >= 0 else -1
+        w[:k] = sign*bound
+        state[:k] = 2*sign
+        w[k] = net - w[:k].sum() if k < n else 0.0
+        state[k:k + 1] = sign
+        return w, state
+
+    def solve(self, gamma_val):
+        w, state, l1_active = self.w.copy(), self.state.copy(), self.l1_active
+        if self.active_set(gamma_val):
+            return self.w.copy()
+        self.w, self.state, self.l1_active = w, state, l1_active
+        self.n_fallbacks += 1
+        if self.fallback is None:
+            self.fallback = CvxSolver(self.mu, self.sigma, solver=self.fallback_solver,
+                                      **self.constraints)
+        return self.fallback.solve(gamma_val)
+
+    def solve_eqp(self, gamma_val, free, grad, sign):
+        """
+        Step over the free weights to the minimum of the quadratic with the
+        working constraints held, and their multipliers. When the free block
+        of the covariance is singular and the minimum is unbounded, returns
+        a descent direction of zero curvature and no multipliers.
+        """
+        k = len(free)
+        A = np.ones((1, k)) if not self.l1_active else np.vstack([np.ones(k), sign[free]])
+        m = len(A)
+        K = np.zeros((k + m, k + m))
+        K[:k, :k] = 2*gamma_val*self.cov[np.ix_(free, free)]
+        K[:k, k:] = A.T
+        K[k:, :k] = A
+        rhs = np.concatenate([-grad[free], np.zeros(m)])
+        scale = np.abs(rhs).max() + 1e-300
+        try:
+            x = np.linalg.solve(K, rhs)
+            if np.all(np.isfinite(x)) and np.abs(K @ x - rhs).max() <= 1e-9*scale:
+                return x[:k], x[k:]
+        except np.linalg.LinAlgError:
+            pass
+        x = np.linalg.lstsq(K, rhs, rcond=None)[0]
+        resid = rhs - K @ x
+        if np.abs(resid).max() <= 1e-9*scale:
+            return x[:k], x[k:]
+        # The residual of the least squares solve lies in the null space of K
+        return resid[:k], None
+
+    def active_set(self, gamma_val):
+        gross, bound = self.constraints['gross'], self.constraints['bound']
+        w, state = self.w, self.state
+        mu, cov = self.mu, self.cov
+        scale = np.abs(mu).max() + 2*gamma_val*np.abs(cov).max()*bound + 1e-300
+        for _ in range(self.max_iter):
+            self.n_iter += 1
+            grad = 2*gamma_val*(cov @ w) - mu
+            sign = np.sign(state)
+            free = np.flatnonzero(np.abs(state) == 1)
+            if not len(free):
+                return False
+            step, multipliers = self.solve_eqp(gamma_val, free, grad, sign)
+            if np.abs(step).max() > self.tol*bound:
+                # Largest step that keeps every free weight on its side of
+                # zero, inside the box and, if not held, inside the L1 limit
+                s = sign[free]
+                wf = w[free]
+                outward = step*s > 0
+                room = np.where(outward, bound - wf*s, wf*s)
+                limits = np.divide(room, np.abs(step), out=np.full(len(step), np.inf), where=step != 0)
+                i = int(np.argmin(limits))
+                alpha = limits[i]
+                l1_rate = s @ step
+                l1_block = False
+                if not self.l1_active and l1_rate > 0:
+                    l1_limit = (gross - np.abs(w).sum()) / l1_rate
+                    if l1_limit < alpha:
+                        alpha, l1_block = l1_limit, True
+                if multipliers is not None and alpha >= 1:
+                    w[free] += step
+                    grad += 2*gamma_val*(cov[:, free] @ step)
+                else:
+                    if not np.isfinite(alpha):
+                        return False
+                    w[free] += max(alpha, 0.0)*step
+                    if l1_block:
+                        self.l1_active = True
+                    else:
+                        j = free[i]
+                        state[j] = 2*sign[j] if outward[i] else 0
+                        w[j] = bound*sign[j] if outward[i] else 0.0
+                    continue
+            elif multipliers is None:
+                return False
+
+            # At the minimum for this working set, so release the most violated constraint
+            lam = multipliers[0]
+            nu = multipliers[1] if self.l1_active else 0.0
+            reduced = grad + lam + nu*sign
+            at_zero = state == 0
+            up = -(grad + lam + nu)
+            down = grad + lam - nu
+            violation = np.where(state == 2, reduced,
+                                 np.where(state == -2, -reduced,
+                                          np.where(at_zero, np.maximum(up, down), -np.inf)))
+            j = int(np.argmax(violation))
+            worst = violation[j]
+            if self.l1_active and -nu > worst:
+                if -nu <= self.tol*scale:
+                    break
+                self.l1_active = False
+                continue
+            if worst <= self.tol*scale:
+                break
+            if state[j] == 0:
+                state[j] = 1 if up[j] >= down[j] else -1
+            else:
+                state[j] = np.sign(state[j])
+        else:
+            return False
+        np.clip(w, -bound, bound, out=w)
+        return True
+
+
+def get_solver(mu, sigma, solver=None, **constraints):
+    if solver == 'NATIVE':
+        return NativeSolver(mu, sigma, **constraints)
+    return CvxSolver(mu, sigma, solver=solver, **constraints)
+
+
+def make_frontier(gamma_vals, weights, mu, sigma, solve_time):
+    variance = portfolio_variance(weights, sigma)
+    frontier = {'gamma': np.asarray(gamma_vals, dtype=float),
+                'weights': weights,
+                'ret': weights @ mu,
+                'risk': np.sqrt(np.clip(variance, 0, None)),
+                'solve_time': np.asarray(solve_time, dtype=float)}
+    return frontier
+
+
+def solve_frontier(mu, sigma, gamma_vals=GAMMA_VALS, solver=None, **constraints):
+    mu = np.asarray(mu, dtype=float).ravel()
+    sigma = as_cov(sigma)
+    frontier_solver = get_solver(mu, sigma, solver, **constraints)
+    weights = np.zeros((len(gamma_vals), len(mu)))
+    solve_time = np.zeros(len(gamma_vals))
+    for i, gamma_val in enumerate(gamma_vals):
+        start = perf_counter()
+        weights[i] = frontier_solver.solve(gamma_val)
+        solve_time[i] = perf_counter() - start
+    return make_frontier(gamma_vals, weights, mu, sigma, solve_time)
+
+
+def get_sharpe(frontier):
+    # Excess return over the highest gamma (lowest risk) portfolio per unit risk
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (frontier['ret'] - frontier['ret'][-1]) / frontier['risk']
+
+
+def max_sharpe_index(frontier):
+    return int(np.nanargmax(get_sharpe(frontier)))
+
+
+def search_max_sharpe(mu, sigma, gamma_lo=1e-2, gamma_hi=1e3, tol=0.01, max_solves=40,
+                      solver=None, **constraints):
+    """
+    Golden section search over log10(gamma) for the max Sharpe point. Returns
+    the solved points as a frontier sorted by gamma, like solve_frontier.
+    """
+    mu = np.asarray(mu, dtype=float).ravel()
+    sigma = as_cov(sigma)
+    frontier_solver = get_solver(mu, sigma, solver, **constraints)
+    solved = {}
+
+    def solve(log_gamma):
+        if log_gamma not in solved:
+            start = perf_counter()
+            wts = frontier_solver.solve(10**log_gamma)
+            solved[log_gamma] = (wts, perf_counter() - start)
+        return solved[log_gamma][0]
+
+    def sharpe(log_gamma):
+        wts = solve(log_gamma)
+        risk = np.sqrt(max(portfolio_variance(wts, sigma), 0))
+        return (wts @ mu - ref_ret) / risk if risk > 0 else -np.inf
+
+    invphi = (np.sqrt(5) - 1) / 2
+    a, b = np.log10(gamma_lo), np.log10(gamma_hi)
+    ref_ret = solve(b) @ mu
+    c = b - invphi*(b - a)
+    d = a + invphi*(b - a)
+    while b - a > tol and len(solved) < max_solves:
+        if sharpe(c) > sharpe(d):
+            b, d = d, c
+            c = b - invphi*(b - a)
+        else:
+            a, c = c, d
+            d = a + invphi*(b - a)
+
+    log_gammas = sorted(solved)
+    weights = np.array([solved[x][0] for x in log_gammas])
+    solve_time = [solved[x][1] for x in log_gammas]
+    return make_frontier(10**np.array(log_gammas), weights, mu, sigma, solve_time)
+
+
+def constraint_violation(weights, net=0.0, gross=1.0, bound=0.05):
+    # Largest violation of any constraint per row of weights, zero when feasible
+    return np.max([np.abs(weights.sum(axis=1) - net),
+                   np.clip(np.abs(weights).sum(axis=1) - gross, 0, None),
+                   np.clip(np.abs(weights).max(axis=1) - bound, 0, None)], axis=0)
+
+
+def check_native_solver(mu, sigma, gamma_vals=GAMMA_VALS, solver='CLARABEL', objective_tol=1e-8,
+                        constraint_tol=1e-9, **constraints):
+    """
+    Cross-checks the native solver against cvxpy over a gamma sweep. Weights
+    are not compared, since the optimum need not be unique and the reference
+    is usually the less accurate of the two. Instead the native objective must
+    be within objective_tol (absolute) of the reference or better, and the
+    native weights must meet every constraint to within constraint_tol.
+    """
+    native = solve_frontier(mu, sigma, gamma_vals, solver='NATIVE', **constraints)
+    reference = solve_frontier(mu, sigma, gamma_vals, solver=solver, **constraints)
+    objective = lambda f: f['ret'] - f['gamma']*f['risk']**2
+    report = pd.DataFrame(data={
+        'max_weight_diff': np.abs(native['weights'] - reference['weights']).max(axis=1),
+        'objective_gap': objective(reference) - objective(native),
+        'constraint_violation': constraint_violation(native['weights'], **constraints),
+        'native_time': native['solve_time'],
+        'cvxpy_time': reference['solve_time'],
+        }, index=pd.Index(gamma_vals, name='gamma'))
+    report['within_tol'] = ((report['objective_gap'] <= objective_tol)
+                            & (report['constraint_violation'] <= constraint_tol))
+    return report
+
+
+def concat_frontiers(frontiers):
+    return {key: np.concatenate([frontier[key] for frontier in frontiers])
+            for key in frontiers[0]}
+
+
+def solve_task(task):
+    rdf, rpreds, gamma_vals, search, cov_method, kwargs = task
+    mu = rpreds.values
+    sigma = estimate_cov(rdf, cov_method)
+    if search:
+        return search_max_sharpe(mu, sigma, **kwargs)
+    return solve_frontier(mu, sigma, gamma_vals, **kwargs)
+
+
+def optimize_portfolios(problems, gamma_vals=GAMMA_VALS, search=False, gamma_splits=1,
+                        cov_method='sample', n_workers=None, **kwargs):
+    """
+    Solves many (returns DataFrame, predictions Series) problems over a process
+    pool. problems is a list, or a dict keyed by rebalance date, and the results
+    come back in the same order (dates sorted). Each date's gamma grid can be
+    split into gamma_splits contiguous segments, which are warm started within
+    the segment and solved in parallel.
+    """
+    if isinstance(problems, dict):
+        keys = sorted(problems)
+        problem_list = [problems[key] for key in keys]
+    else:
+        keys = None
+        problem_list = list(problems)
+    if search:
+        gamma_splits = 1
+    segments = np.array_split(np.asarray(gamma_vals), gamma_splits)
+    tasks = [(rdf, rpreds, segment, search, cov_method, kwargs)
+             for rdf, rpreds in problem_list for segment in segments]
+
+    if n_workers == 1:
+        frontiers = list(map(solve_task, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            frontiers = list(executor.map(solve_task, tasks))
+
+    results = []
+    for i, (rdf, rpreds) in enumerate(problem_list):
+        frontier = concat_frontiers(frontiers[i*gamma_splits:(i+1)*gamma_splits])
+        wtidx = max_sharpe_index(frontier)
+        results.append({'frontier': frontier,
+                        'index': wtidx,
+                        'weights': pd.Series(frontier['weights'][wtidx], index=rpreds.index)})
+    if keys is not None:
+        return dict(zip(keys, results))
+    return results
+
+
+def plot_frontier(frontier, wtidx):
+    import matplotlib.pyplot as plt
+
+    risk_data = frontier['risk']
+    ret_data = frontier['ret']
+    gamma_vals = frontier['gamma']
+    markers_on = [wtidx]
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    plt.plot(risk_data, ret_data, 'g-')
+    for marker in markers_on:
+        plt.plot(risk_data[marker], ret_data[marker], 'bs')
+        ax.annotate(r"$\gamma = %.2f$" % gamma_vals[marker], 
+                    xy=(risk_data[marker]+0.0002, 
+                        ret_data[marker]-0.0005))
+    plt.xlabel('Risk')
+    plt.ylabel('Return')
+    plt.show()
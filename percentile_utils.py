@@ -0,0 +1,124 @@
+"""
+Percentile ranks for dashboard metrics. Ranks follow scipy's percentileofscore
+with kind='rank' on a 0-1 scale. The rank of the latest value is computed for
+all columns at once, and rolling ranks over a trailing window use a Fenwick
+tree over the value ranks, so a full rolling series costs O(n log n) per
+column instead of re-ranking every window.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Trailing windows in trading days
+ROLLING_WINDOWS = {'1y': 252, '3y': 756}
+
+
+def rank_pct(left, right, n):
+    # percentileofscore kind='rank': the mean of the strict and weak ranks,
+    # where an exact match counts as one more observation at or below
+    return (left + right + (right > left)) * 0.5 / n
+
+
+def current_percentiles(df):
+    """
+    Percentile rank of each column's last value within its whole history,
+    ignoring NaNs. Returns a Series indexed by column.
+    """
+    values = df.values.astype(float)
+    last = values[-1]
+    n = np.sum(~np.isnan(values), axis=0)
+    left = np.sum(values < last, axis=0)
+    right = np.sum(values <= last, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct = np.where(np.isnan(last), np.nan, rank_pct(left, right, n))
+    return pd.Series(pct, index=df.columns)
+
+
+def rolling_rank(x, window, min_periods=1):
+    """
+    Percentile rank of x[t] among the non-NaN values of x[t-window+1:t+1],
+    for every t. The window is counted in rows, as in pandas rolling.
+    """
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    out = np.full(n, np.nan)
+    valid = ~np.isnan(x)
+    vals = np.unique(x[valid])
+    ranks = np.zeros(n, dtype=np.int64)
+    ranks[valid] = np.searchsorted(vals, x[valid])
+    ranks = ranks.tolist()
+    tree = [0] * (len(vals) + 1)
+
+    def add(i, delta):
+        i += 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(i):
+        # Number of window values with rank below i
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    count = 0
+    for t in range(n):
+        if valid[t]:
+            add(ranks[t], 1)
+            count += 1
+        if t >= window and valid[t - window]:
+            add(ranks[t - window], -1)
+            count -= 1
+        if valid[t] and count >= min_periods:
+            left = prefix(ranks[t])
+            right = prefix(ranks[t] + 1)
+            out[t] = rank_pct(left, right, count)
+    return out
+
+
+def rolling_percentiles(df, window, min_periods=1):
+    return pd.DataFrame({col: rolling_rank(df[col].values, window, min_periods) for col in df.columns},
+                        index=df.index)
+
+
+def get_percentile_table(df, windows=ROLLING_WINDOWS, decimals=2):
+    """
+    Latest value and percentile ranks per column, in the gexdf layout: one
+    row per metric with 'metric' and 'pct' (whole history) followed by one
+    'pct_<name>' column per trailing window.
+    """
+    table = pd.DataFrame({'metric': df.iloc[-1], 'pct': current_percentiles(df)})
+    for name, window in windows.items():
+        # Only the last rank of the trailing window is needed here
+        table['pct_{}'.format(name)] = current_percentiles(df.iloc[-window:])
+    return table.round({col: decimals for col in table.columns if col != 'metric'})
+
+
+def check_percentiles(n_obs=1500, n_cols=6, window=252, seed=None):
+    """
+    Checks the ranks against scipy's percentileofscore on random data with
+    ties and NaNs, for the last value and for a rolling window.
+    """
+    from scipy.stats import percentileofscore
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.standard_normal((n_obs, n_cols)), 1)
+    values[rng.random(values.shape) < 0.02] = np.nan
+    values[-1] = np.round(rng.standard_normal(n_cols), 1)
+    df = pd.DataFrame(values, columns=['col{}'.format(i) for i in range(n_cols)])
+
+    def scipy_rank(x, score):
+        x = x[~np.isnan(x)]
+        return percentileofscore(x, score) / 100
+
+    expected = df.apply(lambda x: scipy_rank(x.values, x.iloc[-1]))
+    assert np.allclose(current_percentiles(df), expected), 'Current percentiles differ from scipy'
+
+    rolled = rolling_percentiles(df, window)
+    for col in df.columns:
+        x = df[col].values
+        ts = [t for t in range(n_obs) if not np.isnan(x[t])]
+        expected = [scipy_rank(x[max(0, t - window + 1):t + 1], x[t]) for t in ts]
+        assert np.allclose(rolled[col].values[ts], expected), 'Rolling percentiles differ from scipy'
+    return True
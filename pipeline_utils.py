@@ -0,0 +1,90 @@
+"""
+Small dependency-aware task runner. Each stage names the stages it depends on
+and is run once, as soon as its inputs are ready, with independent stages
+running concurrently on a thread pool. Stages flagged main_thread (anything
+that touches the ib_insync event loop) are run on the calling thread instead.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from time import perf_counter
+import pandas as pd
+
+
+class Stage:
+    def __init__(self, func, deps=(), main_thread=False):
+        self.func = func
+        self.deps = list(deps)
+        self.main_thread = main_thread
+
+
+def check_stages(stages):
+    for name, stage in stages.items():
+        missing = [dep for dep in stage.deps if dep not in stages]
+        if missing:
+            raise KeyError('Stage {} depends on unknown stages {}'.format(name, missing))
+    # Kahn's algorithm, only to reject cycles up front
+    remaining = {name: set(stage.deps) for name, stage in stages.items()}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError('Dependency cycle between stages {}'.format(sorted(remaining)))
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_stage(stage, results):
+    start = perf_counter()
+    value = stage.func(*[results[dep] for dep in stage.deps])
+    return value, start, perf_counter()
+
+
+def run_pipeline(stages, max_workers=8, verbose=True):
+    """
+    Runs a dict of name -> Stage and returns (results, timings), where results
+    maps each stage name to its return value and timings has one row per
+    stage with its start, end and wall time in seconds relative to the start
+    of the run.
+    """
+    check_stages(stages)
+    results = {}
+    times = {}
+    pending = dict(stages)
+    running = {}
+    t0 = perf_counter()
+
+    def is_ready(name):
+        return all(dep in results for dep in pending[name].deps)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            ready = [name for name in pending if is_ready(name)]
+            for name in ready:
+                if not pending[name].main_thread:
+                    running[executor.submit(run_stage, pending.pop(name), results)] = name
+            # Main thread stages run one at a time while the pool keeps working
+            main_ready = [name for name in ready if name in pending]
+            if main_ready:
+                name = main_ready[0]
+                results[name], start, end = run_stage(pending.pop(name), results)
+                times[name] = (start - t0, end - t0)
+                if verbose:
+                    print('{}: {:.2f}s'.format(name, end - start))
+                continue
+            if not running:
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], start, end = future.result()
+                times[name] = (start - t0, end - t0)
+                if verbose:
+                    print('{}: {:.2f}s'.format(name, end - start))
+
+    timings = pd.DataFrame.from_dict(times, orient='index', columns=['start', 'end'])
+    timings['seconds'] = timings['end'] - timings['start']
+    if verbose:
+        print('Pipeline finished in {:.2f}s (sum of stages {:.2f}s)'.format(
+            timings['end'].max(), timings['seconds'].sum()))
+    return results, timings.sort_values('start')
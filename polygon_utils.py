@@ -0,0 +1,106 @@
+"""
+Concurrent daily bar fetches from the polygon aggregates API with a local disk
+cache, so repeated runs only request the days that are not already cached.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+from os.path import join
+from pathlib import Path
+import time
+import pandas as pd
+
+CACHE_PATH = join(Path.home(), '.polygon_cache', 'daily')
+
+
+def to_daily_index(df):
+    idx = pd.DatetimeIndex(df.index)
+    if idx.tz is not None:
+        idx = idx.tz_convert('America/New_York').tz_localize(None)
+    df.index = idx.normalize()
+    return df
+
+
+def fetch_bars(api, symbol, start, end, retries=3, backoff=1.0):
+    for attempt in range(retries + 1):
+        try:
+            bars = api.polygon.historic_agg_v2(symbol=symbol,
+                                               multiplier=1,
+                                               timespan='day',
+                                               _from=start,
+                                               to=end).df
+            return to_daily_index(bars)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            wait = backoff * 2**attempt
+            logging.warning('Bar request for {} failed ({}), retrying in {}s'.format(symbol, e, wait))
+            time.sleep(wait)
+
+
+def read_cache(symbol, cache_path):
+    bar_file = join(cache_path, '{}.csv'.format(symbol))
+    meta_file = join(cache_path, '{}.json'.format(symbol))
+    if not (os.path.isfile(bar_file) and os.path.isfile(meta_file)):
+        return None, None
+    bars = pd.read_csv(bar_file, index_col=0, parse_dates=True)
+    with open(meta_file) as f:
+        coverage = json.load(f)
+    return bars, coverage
+
+
+def write_cache(symbol, bars, coverage, cache_path):
+    if not os.path.isdir(cache_path):
+        os.makedirs(cache_path, exist_ok=True)
+    bars.to_csv(join(cache_path, '{}.csv'.format(symbol)))
+    with open(join(cache_path, '{}.json'.format(symbol)), 'w') as f:
+        json.dump(coverage, f)
+
+
+def get_bars(api, symbol, start, end, cache_path=CACHE_PATH, retries=3, backoff=1.0):
+    # Coverage records the requested date range, so weekends and holidays
+    # inside it are not mistaken for missing days. It also records the day of
+    # the fetch: a covered day on or after it may hold a partial bar.
+    today = datetime.today().strftime('%Y-%m-%d')
+    bars, coverage = read_cache(symbol, cache_path)
+    if bars is None:
+        bars = fetch_bars(api, symbol, start, end, retries, backoff)
+        coverage = {'start': start, 'end': end, 'fetched': today}
+    else:
+        new_bars = [bars]
+        if start < coverage['start']:
+            before = (pd.Timestamp(coverage['start']) - timedelta(days=1)).strftime('%Y-%m-%d')
+            new_bars.insert(0, fetch_bars(api, symbol, start, before, retries, backoff))
+            coverage['start'] = start
+        fetched = coverage.get('fetched', coverage['end'])
+        if end > coverage['end'] or end >= fetched:
+            # Covered days from the fetch day on are fetched again in case they were partial bars
+            since = max(coverage['start'], min(fetched, coverage['end']))
+            coverage['end'] = max(end, coverage['end'])
+            new_bars.append(fetch_bars(api, symbol, since, coverage['end'], retries, backoff))
+            coverage['fetched'] = today
+        if len(new_bars) > 1:
+            bars = pd.concat(new_bars)
+            bars = bars[~bars.index.duplicated(keep='last')].sort_index()
+        else:
+            return bars.loc[start:end]
+    write_cache(symbol, bars, coverage, cache_path)
+    return bars.loc[start:end]
+
+
+def get_bulk_rets(api, symbols, ndays, columns=None, cache_path=CACHE_PATH, max_workers=8,
+                  retries=3, backoff=1.0):
+    today = datetime.today()
+    current = today.strftime('%Y-%m-%d')
+    past = (today - timedelta(days=ndays*2)).strftime('%Y-%m-%d')
+
+    def get_symbol_rets(symbol):
+        bars = get_bars(api, symbol, past, current, cache_path, retries, backoff)
+        return bars.close.pct_change()[-ndays:]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        rets = list(executor.map(get_symbol_rets, symbols))
+    return pd.concat(rets, axis=1, keys=symbols if columns is None else columns)
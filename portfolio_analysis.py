@@ -11,13 +11,8 @@ from os.path import join
 from pathlib import Path
 from ib_insync import *
 from ib_insync import util, IB
-import nasdaqdatalink as nq
-import requests
-from io import StringIO
-from scipy.stats import percentileofscore
 from talib import RSI
 import openpyxl
-from openpyxl.worksheet.table import Table
 from subprocess import Popen
 import subprocess
 from time import sleep
@@ -26,35 +21,18 @@ os.chdir(join(Path.home(), 'investments\port_code'))
 from ibc_manager import launch_ibc, is_ib_gateway_running
 import ibc_manager
 from nasdaqdl_utils import get_sp500_weights
-import nasdaqdl_utils as nqct
-
-
-def get_gexplus(apikey):
-    gexplus_url = 'https://squeezemetrics.com/monitor/api/yachtclub/gexplus'
-    params = {'key': apikey}
-    resp = requests.get(gexplus_url, params=params)
-    pd.read_csv(StringIO(resp.text))
-    return pd.read_csv(StringIO(resp.text))
-
-def get_sumo(apikey):
-    sumo_url = 'https://squeezemetrics.com/monitor/api/yachtclub/sumo'
-    params = {'key': apikey}
-    resp = requests.get(sumo_url, params=params)
-    pd.read_csv(StringIO(resp.text))
-    return pd.read_csv(StringIO(resp.text))
-
-def get_mkt_data(contract):
-    #ib.reqMarketDataType(2)
-    data = ib.reqMktData(ib.qualifyContracts(Contract(conId=contract.conId))[0])
-    return data
-
-def get_sharadar_sec_and_ind(symbols):
-    nasdaq_api_key = 'api key'
-    secind = nq.get_table('SHARADAR/TICKERS', ticker=[x for x in symbols if x != "ES"], paginate=True, api_key=nasdaq_api_key)
-    secind = secind.drop(columns=['table'])[['ticker', 'sector', 'industry']].drop_duplicates()
-    secind.rename(columns={'ticker': 'symbol'}, inplace=True)
-    secind.set_index('symbol', inplace=True, drop=True)
-    return secind
+from mktdata_utils import snapshot_tickers, get_ticker_fields
+from excel_utils import write_df_excel, replace_table
+from snapshot_utils import SNAPSHOT_PATH, save_snapshots, read_sheet_cached
+from pipeline_utils import Stage, run_pipeline
+from sharadar_utils import refresh_reference, get_sec_ind, get_sec_ind_table
+from squeeze_utils import get_gexplus, get_sumo
+from levels_utils import update_levels
+from percentile_utils import get_percentile_table
+from scenario_utils import run_scenarios, get_scenario_grid, get_stress_summary
+
+NASDAQ_API_KEY = 'api key'
+
 
 def get_custom_fields():
     custom_field_path = r'Portfolio\custom_fields.csv'
@@ -68,21 +46,7 @@ def check_custom_fields_missing_securities(portfoliodf, customdf):
     missing_secs = [item for item in portfoliodf.index.to_list() if item not in customdf.index.to_list()]
     print('Securities missing from custom fields table: {}'.format(missing_secs))
 
-def calc_delta(mkt_data):
-    try:
-        delta = mkt_data.askGreeks.delta
-    except:
-        delta = 1
-    return delta
-
-def calc_undprice(mkt_data):
-    try:
-        undprice = mkt_data.askGreeks.undPrice
-    except:
-        undprice = mkt_data.marketPrice()
-    return undprice
-
-def get_positions(account):
+def get_raw_positions(account):
     positions = ib.positions(account)
     df = pd.DataFrame(positions)
     pos_list = []
@@ -92,29 +56,24 @@ def get_positions(account):
         pos_list.append(cvars)
     contract_df = pd.DataFrame(pos_list)
     pdf = pd.merge(contract_df, df, left_index=True, right_index=True, how='left')
-    pdf['mkt_data'] = pdf['contract'].apply(lambda x: get_mkt_data(x))
-    ib.sleep(3)
-    pdf['price'] = pdf['mkt_data'].apply(lambda x: x.marketPrice())
-    pdf['greeks'] = pdf['mkt_data'].apply(lambda x: x.askGreeks)    
-    pdf['delta'] = pdf['mkt_data'].apply(lambda x: calc_delta(x))
-    pdf['undprice'] = pdf['mkt_data'].apply(lambda x: calc_undprice(x))
+    tickers = snapshot_tickers(ib, pdf['contract'].tolist())
+    pdf = pd.concat([pdf, get_ticker_fields(tickers)], axis=1)
     pdf['multiplier'] = pd.to_numeric(pdf['multiplier'], errors='coerce').fillna(value=1.0)
     pdf['deltavalue'] = np.round(pdf['multiplier'] * pdf['position'] * pdf['undprice'] * pdf['delta'])
     pdf['mkt_val'] = np.round(pdf['multiplier'] * pdf['position'] * pdf['price'])
     pdf['cost'] = np.round(pdf['avgCost']*pdf['position'],2)
     pdf['pnl'] = pdf['mkt_val'] - pdf['cost']
     pdf['pnl_pct'] = (pdf['mkt_val'] / pdf['cost']) -1
-    
     pdf.set_index('symbol', drop=True, inplace=True)
-    secind = get_sharadar_sec_and_ind(pdf.index.to_list())
+    return pdf
+
+def merge_position_fields(pdf, secind, custom_fields):
     pdf = pd.merge(pdf, secind, on='symbol', how='left')
-    custom_fields = get_custom_fields()
     check_custom_fields_missing_securities(pdf, custom_fields)
     pdf = pd.merge(pdf, custom_fields, on='symbol', how='left')
     return pdf
 
-def get_portfolio_stats(account):
-    pdf = get_positions(account)
+def get_portfolio_stats(account, pdf):
     summary = pd.DataFrame(ib.accountSummary(account))
     mkt_value = pdf['mkt_val'].sum()
     delta_value = pdf['deltavalue'].sum()
@@ -172,143 +131,58 @@ def check_if_market_hours():
     if now.time()>time(8, 30) and now.time()<time(15, 0):
         return True
 
-def get_spx_levels():
-    spx_cont = ib.reqContractDetails(Index('SPX'))[0].contract
-    spx_data = ib.reqHistoricalData(spx_cont, 
-                         datetime.now(), 
-                         durationStr='1 Y', 
-                         whatToShow='TRADES', 
-                         barSizeSetting='1 day', 
-                         useRTH=False)
-    
-    spxdf = pd.DataFrame(spx_data)
-    if check_if_market_hours():
-        spxdf = spxdf.iloc[:-1]
-
-    spxdf['SMA20'] = spxdf.close.rolling(20).mean()
-    spxdf['SMA50'] = spxdf.close.rolling(50).mean()
-    spxdf['SMA100'] = spxdf.close.rolling(100).mean()
-    spxdf['SMA200'] = spxdf.close.rolling(200).mean()
-    spxdf['vol20'] = spxdf.close.rolling(20).std()
-    spxdf['upper20_10'] = spxdf['SMA20'] + spxdf['vol20']*1.0
-    spxdf['upper20_15'] = spxdf['SMA20'] + spxdf['vol20']*1.5
-    spxdf['upper20_23'] = spxdf['SMA20'] + spxdf['vol20']*2.3
-    spxdf['lower20_10'] = spxdf['SMA20'] - spxdf['vol20']*1.0
-    spxdf['lower20_15'] = spxdf['SMA20'] - spxdf['vol20']*1.5
-    spxdf['lower20_23'] = spxdf['SMA20'] - spxdf['vol20']*2.3
-    
-    spxdf['ylow'] = spxdf.iloc[-1]['low']
-    spxdf['yhigh'] = spxdf.iloc[-1]['high']
-    
-    SQUEEZEAPIKEY = ['store locally']
-    sumo = get_sumo(SQUEEZEAPIKEY)
-    spxdf['mo'] = sumo.iloc[0][0]
-    spxdf['mid'] = sumo.iloc[1][0]
-    spxdf['su'] = sumo.iloc[2][0]
-    
-    spxlevels = spxdf[['close', 'SMA20', 'SMA50', 'SMA100', 'SMA200', 
+def get_index_levels(symbols=('SPX',)):
+    contracts = {symbol: ib.reqContractDetails(Index(symbol))[0].contract for symbol in symbols}
+    return update_levels(ib, contracts, drop_last=check_if_market_hours())
+
+def get_spx_levels(levels, sumo):
+    spxlevels = levels.loc['SPX'].copy()
+    spxlevels['mo'] = sumo.iloc[0][0]
+    spxlevels['mid'] = sumo.iloc[1][0]
+    spxlevels['su'] = sumo.iloc[2][0]
+    spxlevels = spxlevels[['close', 'SMA20', 'SMA50', 'SMA100', 'SMA200', 
            'upper20_10', 'upper20_15', 'upper20_23', 'su', 'mid', 'mo',
-           'lower20_10', 'lower20_15', 'lower20_23', 'ylow', 'yhigh']].iloc[-1]
+           'lower20_10', 'lower20_15', 'lower20_23', 'ylow', 'yhigh']]
+    spxlevels.name = None
     return spxlevels.sort_values(ascending=False)
 
 
-def get_level_df():   
-    levels = get_spx_levels()
-    return pd.DataFrame({'SPX': round(levels,2), 'ES': round(levels*get_spx_to_es_conversion()*4)/4})
+def get_level_df(levels, es_conversion):
+    ldf = pd.DataFrame({'SPX': round(levels,2), 'ES': round(levels*es_conversion*4)/4})
+    ldf['pct'] = (ldf['SPX']/ldf['SPX'].close-1)
+    return ldf
 
 
-def insert_df_excel(df, start_col, start_row, sheet, include_cols=False):
-    col_list = [chr(i) for i in range(ord(start_col),ord(chr(ord(start_col)+len(df.columns)-1))+1)]
-    col_dict = dict(zip(col_list, df.columns))
-    spacer = 0
-    if include_cols:
-        spacer = 1
-        for col in col_list:
-            rowpos = ord(col)-64
-            cell = str(col+str(1))
-            sheet[cell] = df.columns[rowpos-1]
-    for key, value in col_dict.items():
-        for i in range(len(df)):
-            row = start_row+i+spacer
-            cell = str(key+str(row))
-            sheet[cell] = df[value][i]
+def get_gex_df(gp):
+    gpdf = pd.DataFrame(gp[['GEX', 'VEX', 'GEX+', 'DIX', 'NPD', 'VGR']])
+    return get_percentile_table(gpdf)
 
 
-def update_portfolio_data_sheet():
-    pdf = get_positions(account)
-    pdf.drop(columns=['contract', 'secIdType', 'secId', 'comboLegsDescrip', 'comboLegs', 'mkt_data',
+def get_portfolio_data_df(pdf):
+    pdf = pdf.drop(columns=['contract', 'secIdType', 'secId', 'comboLegsDescrip', 'comboLegs', 'mkt_data',
                  'lastTradeDateOrContractMonth', 'primaryExchange', 'localSymbol', 'tradingClass',
-                 'includeExpired', 'deltaNeutralContract'], inplace=True,)
+                 'includeExpired', 'deltaNeutralContract'])
     pdf['symbol'] = pdf.index
     pdfcols = ['symbol', 'secType', 'exchange', 'sector', 'industry', 
                'mkt_val', 'price', 'position', 'undprice', 'delta', 'deltavalue',
                'Underlying Asset Class', 'Region', 'Country', 
                'avgCost', 'cost', 'pnl', 'pnl_pct',
                'strike', 'right', 'multiplier', 'currency', 'account', 'conId']
-    pdf = pdf[pdfcols]
-    
-    # PORTFOLIO SHEET OPERATIONS
-    portfoliosheet = wb['portfolio_data']
-    portfoliosheet.tables
-    try:
-        portfoliosheettablestyle = portfoliosheet.tables['PortfolioData'].tableStyleInfo
-        del portfoliosheet.tables["PortfolioData"]
-    except:
-        portfoliosheettablestyle = portfoliosheet.tables['Table_1'].tableStyleInfo
-        del portfoliosheet.tables["Table_1"]        
-    portfoliosheet.delete_cols(1,100)
-    portfoliosheetdata = pdf.values.tolist()
-    portfoliosheetcolumns = list(pdf.columns.values)
-    portfoliosheet.append(portfoliosheetcolumns)
-    for row in portfoliosheetdata:
-        portfoliosheet.append(row)
-    portfoliosheetrange = portfoliosheet.calculate_dimension()
-    portfoliosheet.move_range(portfoliosheetrange, rows=-portfoliosheet.min_row+1, cols=0)
-    portfoliosheettable = Table(displayName="PortfolioData", ref=portfoliosheet.calculate_dimension())
-    portfoliosheettable.tableStyleInfo = portfoliosheettablestyle
-    portfoliosheet.add_table(portfoliosheettable)
-
-
-def update_portfolio_dashboard_sheet():
-    dashboardsheet = wb['Portfolio Dashboard']
-    
-    portfolio_stats = get_portfolio_stats(account)
-    pstatsdf = pd.DataFrame.from_dict(portfolio_stats, orient='index', columns=['stats'])
-    pstatsdf.reset_index(inplace=True)
-    dashboardsheet['C3'] = datetime.now().strftime('%m-%d-%Y %H:%M:%S')
-    insert_df_excel(pstatsdf, 'B', 4, dashboardsheet)
+    return pdf[pdfcols].reset_index(drop=True)
 
-    ldf = get_level_df()
-    ldf['pct'] = (ldf['SPX']/ldf['SPX'].close-1)
-    dashboardsheet['L5'] = ldf['SPX'].close
-    dashboardsheet['L6'] = ldf['ES'].close
-    ldf.reset_index(inplace=True)
-    insert_df_excel(ldf, 'B', 20, dashboardsheet)
-    
-    SQUEEZEAPIKEY = ['store locally']
-    gp = get_gexplus(SQUEEZEAPIKEY)
-    gpdf = pd.DataFrame(gp[['GEX', 'VEX', 'GEX+', 'DIX', 'NPD', 'VGR']])
-    pct = np.round(gpdf.apply(lambda x: percentileofscore(x, x.iloc[-1]))/100,2)
-    gexdf = pd.DataFrame(data={'metric': gpdf.iloc[-1], 'pct': pct})
-    gexdf.reset_index(inplace=True)
-    insert_df_excel(gexdf, 'B', 38, dashboardsheet)
 
+def get_stats_df(portfolio_stats):
+    pstatsdf = pd.DataFrame.from_dict(portfolio_stats, orient='index', columns=['stats'])
+    return pstatsdf.reset_index()
 
-def update_stockport_sheet():
-    stockportsheet = wb['Stock Portfolio']
+
+def get_stockport_df():
     sdf, idf, spwdf = get_sp500_weights('nasdaq api key')
-    sdf = pd.DataFrame(sdf).reset_index()
-    insert_df_excel(sdf, 'C', 4, stockportsheet)
-
-def openpy_to_df(sheet_name):
-    ws = wb[sheet_name]
-    df = pd.DataFrame(ws.values)
-    df.columns = df.iloc[0].values
-    return df[1:]
-
-def update_companies(nq_sec_ind):
-    df_input = openpy_to_df('Input Companies')
-    df_jpsi = openpy_to_df('JPSectors')
+    return pd.DataFrame(sdf).reset_index()
+
+
+def get_companies_df(df_input, df_jpsi, nq_sec_ind):
+    df_input = df_input.copy()
     df_input['Industry'] = df_input['Industry'].str.replace('&amp;', '&')
     df_input['Industry'] = df_input['Industry'].str.replace('  ', ' ')
     df_m = pd.merge(df_input, df_jpsi, left_on='Industry', right_on='JP Sub Industry', how='left')
@@ -318,24 +192,75 @@ def update_companies(nq_sec_ind):
     df_ma['price target'] = pd.to_numeric(df_ma['price target'].str.split('$', expand=True)[1])
     df_ma['Last close price'] = pd.to_numeric(df_ma['Last close price'].str.split('$', expand=True)[1])
     df_ma['pct_to_target'] = round(df_ma['price target'] / df_ma['Last close price'] -1, 3)
-    df_ma = df_ma[['Ticker', 'Company Name', 'JP Sector', 'JP Sub Sector', 
-                   'JP Industry', 'JP Sub Industry', 'sector', 'industry', 
-                   'Focus', 'Rating', 'Last close price', 'price target', 
-                   'pct_to_target', 'price target date']]
+    return df_ma[['Ticker', 'Company Name', 'JP Sector', 'JP Sub Sector', 
+                  'JP Industry', 'JP Sub Industry', 'sector', 'industry', 
+                  'Focus', 'Rating', 'Last close price', 'price target', 
+                  'pct_to_target', 'price target date']]
+
+
+def get_report_stages():
+    # Anything that talks to IB stays on the main thread, where the
+    # ib_insync event loop lives. Every other fetch runs on the pool.
+    SQUEEZEAPIKEY = ['store locally']
+    return {
+        'raw_positions': Stage(lambda: get_raw_positions(account), main_thread=True),
+        'reference': Stage(lambda: refresh_reference(NASDAQ_API_KEY)),
+        'secind': Stage(lambda pdf, _: get_sec_ind([x for x in pdf.index.to_list() if x != "ES"]),
+                        ['raw_positions', 'reference']),
+        'custom_fields': Stage(get_custom_fields),
+        'positions': Stage(merge_position_fields, ['raw_positions', 'secind', 'custom_fields']),
+        'portfolio_stats': Stage(lambda pdf: get_portfolio_stats(account, pdf), ['positions'], main_thread=True),
+        'index_levels': Stage(get_index_levels, main_thread=True),
+        'es_conversion': Stage(get_spx_to_es_conversion, main_thread=True),
+        'sumo': Stage(lambda: get_sumo(SQUEEZEAPIKEY)),
+        'gexplus': Stage(lambda: get_gexplus(SQUEEZEAPIKEY)),
+        'nq_sec_ind': Stage(lambda _: get_sec_ind_table(), ['reference']),
+        'input_companies': Stage(lambda: read_sheet_cached(port_analysis_path, 'Input Companies')),
+        'jp_sectors': Stage(lambda: read_sheet_cached(port_analysis_path, 'JPSectors')),
+        'portfolio_data': Stage(get_portfolio_data_df, ['positions']),
+        'stats_df': Stage(get_stats_df, ['portfolio_stats']),
+        'spx_levels': Stage(get_spx_levels, ['index_levels', 'sumo']),
+        'level_df': Stage(get_level_df, ['spx_levels', 'es_conversion']),
+        'gex': Stage(get_gex_df, ['gexplus']),
+        'stock_portfolio': Stage(get_stockport_df),
+        'browse_companies': Stage(get_companies_df, ['input_companies', 'jp_sectors', 'nq_sec_ind']),
+        'scenarios': Stage(run_scenarios, ['positions']),
+        'scenario_grid': Stage(get_scenario_grid, ['scenarios']),
+        'stress_summary': Stage(lambda results, stats: get_stress_summary(results, stats['liquidation_value']),
+                                ['scenarios', 'portfolio_stats']),
+    }
+
+
+def update_portfolio_data_sheet(pdf):
+    # PORTFOLIO SHEET OPERATIONS
+    portfoliosheet = wb['portfolio_data']
+    replace_table(portfoliosheet, pdf, 'PortfolioData', ['Table_1'])
+
+
+def update_portfolio_dashboard_sheet(dashboard):
+    dashboardsheet = wb['Portfolio Dashboard']
+    dashboardsheet['C3'] = datetime.now().strftime('%m-%d-%Y %H:%M:%S')
+    write_df_excel(dashboard['portfolio_stats'], 'B', 4, dashboardsheet)
+
+    ldf = dashboard['spx_levels']
+    dashboardsheet['L5'] = ldf['SPX'].close
+    dashboardsheet['L6'] = ldf['ES'].close
+    write_df_excel(ldf.reset_index(), 'B', 20, dashboardsheet)
+    write_df_excel(dashboard['gex'][['metric', 'pct']].reset_index(), 'B', 38, dashboardsheet)
+
+
+def update_stockport_sheet(sdf):
+    stockportsheet = wb['Stock Portfolio']
+    write_df_excel(sdf, 'C', 4, stockportsheet)
+
+def update_companies(df_ma):
     bc = wb['Browse Companies']
-    try:
-        bcstyle = bc.tables['BrowseCompany'].tableStyleInfo
-        del bc.tables["BrowseCompany"]
-    except:
-        bcstyle = bc.tables['Table6'].tableStyleInfo
-        del bc.tables["Table6"]
-    bc.delete_cols(1,100)
-    df_ma.columns
-    insert_df_excel(df_ma, 'A', 1, bc, include_cols=True)
-    bctable = Table(displayName="BrowseCompany", ref=bc.calculate_dimension())
-    bctable.tableStyleInfo = bcstyle
-    bc.add_table(bctable)    
+    replace_table(bc, df_ma, 'BrowseCompany', ['Table6'])
+
 
+# Snapshots are always written, the workbook is only opened when exporting
+SAVE_SNAPSHOTS = True
+EXPORT_EXCEL = True
 
 if is_ib_gateway_running() is not None:
     print('Closing existing instance of IB Gateway.')
@@ -358,14 +283,30 @@ if not ib.isConnected():
     ib.isConnected()
     ib.reqPnL(account=account)
     
-port_analysis_path = r'path to portfolio'
-wb = openpyxl.load_workbook(port_analysis_path.strip())
-nq_sec_ind = nqct.get_full_nasdaq_sec_ind_table('nasdaq api')
-update_portfolio_data_sheet()
-update_portfolio_dashboard_sheet()
-update_stockport_sheet()
-update_companies(nq_sec_ind)
+port_analysis_path = r'path to portfolio'.strip()
+results, timings = run_pipeline(get_report_stages())
 ib.disconnect()
-
-wb.save(port_analysis_path)
-print('Portfolio data successfully updated')
+pdf = results['portfolio_data']
+dashboard = {'portfolio_stats': results['stats_df'],
+             'spx_levels': results['level_df'],
+             'gex': results['gex']}
+sdf = results['stock_portfolio']
+df_ma = results['browse_companies']
+
+if SAVE_SNAPSHOTS:
+    outputs = {'portfolio_data': pdf, 'stock_portfolio': sdf, 'browse_companies': df_ma}
+    outputs.update(dashboard)
+    outputs['scenario_grid'] = results['scenario_grid']
+    outputs['stress_summary'] = results['stress_summary']
+    outputs['pipeline_timings'] = timings
+    save_snapshots(outputs)
+    print('Portfolio snapshots saved to {}'.format(SNAPSHOT_PATH))
+
+if EXPORT_EXCEL:
+    wb = openpyxl.load_workbook(port_analysis_path)
+    update_portfolio_data_sheet(pdf)
+    update_portfolio_dashboard_sheet(dashboard)
+    update_stockport_sheet(sdf)
+    update_companies(df_ma)
+    wb.save(port_analysis_path)
+    print('Portfolio data successfully updated')
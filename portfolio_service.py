@@ -0,0 +1,219 @@
+"""
+Long-running portfolio service. Keeps market data subscriptions alive on an IB
+connection and updates the affected position row and the exposure totals on
+every ticker, position or account event, writing a JSON snapshot of the
+current state at a fixed cadence.
+"""
+
+import json
+import math
+import os
+from os.path import join
+from time import monotonic
+from datetime import datetime
+import pandas as pd
+from ib_insync import IB
+from mktdata_utils import qualify_contracts, get_ticker_values
+
+SNAPSHOT_PATH = join('Portfolio', 'live_portfolio.json')
+TOTAL_FIELDS = ['mkt_val', 'deltavalue']
+
+
+def finite(value):
+    try:
+        return value if math.isfinite(value) else 0.0
+    except TypeError:
+        return 0.0
+
+
+def to_json_number(value, ndigits=2):
+    # NaN is not valid JSON, so missing values are written as null
+    try:
+        return round(value, ndigits) if math.isfinite(value) else None
+    except TypeError:
+        return None
+
+
+def get_multiplier(contract):
+    try:
+        return float(contract.multiplier)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class LivePortfolio:
+    """
+    Positions are kept as one dict per conId. Each update subtracts the row's
+    old contribution from the running totals and adds the new one, so every
+    event is O(1) however large the book is. The totals are recomputed from
+    the rows whenever a snapshot is written to stop float drift building up.
+    """
+
+    def __init__(self, ib, account, snapshot_path=SNAPSHOT_PATH, cadence=5.0):
+        self.ib = ib
+        self.account = account
+        self.snapshot_path = snapshot_path
+        self.cadence = cadence
+        self.rows = {}
+        self.pending = {}
+        self.totals = {}
+        self.account_values = {}
+        self.pnl = None
+        self.last_snapshot = None
+        self.reset_totals()
+
+    def reset_totals(self):
+        self.totals = {key: 0.0 for field in TOTAL_FIELDS for key in (field, field + '_gross')}
+
+    def apply_row(self, row, sign):
+        for field in TOTAL_FIELDS:
+            value = finite(row[field])
+            self.totals[field] += sign * value
+            self.totals[field + '_gross'] += sign * abs(value)
+
+    def revalue_row(self, row):
+        # Greeks can arrive with missing fields, which count as NaN here
+        values = [math.nan if row[field] is None else row[field]
+                  for field in ['price', 'undprice', 'delta']]
+        price, undprice, delta = values
+        self.apply_row(row, -1)
+        row['mkt_val'] = row['multiplier'] * row['position'] * price
+        row['deltavalue'] = row['multiplier'] * row['position'] * undprice * delta
+        self.apply_row(row, 1)
+
+    def start(self):
+        for position in self.ib.positions(self.account):
+            self.on_position(position)
+        for account_value in self.ib.accountValues(self.account):
+            self.on_account_value(account_value)
+        self.subscribe_pending()
+        self.ib.pendingTickersEvent += self.on_pending_tickers
+        self.ib.positionEvent += self.on_position
+        self.ib.accountValueEvent += self.on_account_value
+        self.ib.pnlEvent += self.on_pnl
+
+    def subscribe_pending(self):
+        # Qualification blocks, so it happens here rather than in a handler
+        if not self.pending:
+            return
+        contracts = list(self.pending.values())
+        self.pending = {}
+        for contract in qualify_contracts(self.ib, contracts):
+            if contract.conId in self.rows:
+                self.rows[contract.conId]['ticker'] = self.ib.reqMktData(contract)
+
+    def on_position(self, position):
+        if position.account != self.account:
+            return
+        con_id = position.contract.conId
+        row = self.rows.get(con_id)
+        if position.position == 0:
+            if row is not None:
+                self.apply_row(row, -1)
+                if row['ticker'] is not None:
+                    self.ib.cancelMktData(row['ticker'].contract)
+                del self.rows[con_id]
+            self.pending.pop(con_id, None)
+        else:
+            if row is None:
+                row = {'symbol': position.contract.symbol,
+                       'secType': position.contract.secType,
+                       'multiplier': get_multiplier(position.contract),
+                       'price': math.nan, 'greeks': None, 'delta': 1, 'undprice': math.nan,
+                       'mkt_val': 0.0, 'deltavalue': 0.0, 'ticker': None}
+                self.rows[con_id] = row
+                self.pending[con_id] = position.contract
+            row['position'] = position.position
+            row['avgCost'] = position.avgCost
+            self.revalue_row(row)
+        self.maybe_write_snapshot()
+
+    def on_ticker(self, ticker):
+        row = self.rows.get(ticker.contract.conId)
+        if row is None:
+            return
+        row['price'], row['greeks'], row['delta'], row['undprice'] = get_ticker_values(ticker)
+        self.revalue_row(row)
+
+    def on_pending_tickers(self, tickers):
+        for ticker in tickers:
+            self.on_ticker(ticker)
+        self.maybe_write_snapshot()
+
+    def on_account_value(self, account_value):
+        if account_value.account == self.account and account_value.tag in ['NetLiquidation', 'TotalCashValue']:
+            self.account_values[account_value.tag] = float(account_value.value)
+
+    def on_pnl(self, pnl):
+        if pnl.account == self.account:
+            self.pnl = pnl
+
+    def resync_totals(self):
+        self.reset_totals()
+        for row in self.rows.values():
+            self.apply_row(row, 1)
+
+    def get_stats(self):
+        liquidation_value = self.account_values.get('NetLiquidation', math.nan)
+
+        def exposure(value):
+            return to_json_number(value / liquidation_value) if liquidation_value else None
+
+        stats_dict = {'liquidation_value': to_json_number(liquidation_value),
+                      'mkt_value': to_json_number(self.totals['mkt_val'], None),
+                      'delta_value': to_json_number(self.totals['deltavalue'], None),
+                      'net_exposure': exposure(self.totals['mkt_val']),
+                      'gross_exposure': exposure(self.totals['mkt_val_gross']),
+                      'delta_net_exposure': exposure(self.totals['deltavalue']),
+                      'delta_gross_exposure': exposure(self.totals['deltavalue_gross']),
+                      'cash_value': to_json_number(self.account_values.get('TotalCashValue', math.nan)),
+                      }
+        if self.pnl is not None:
+            stats_dict['dailyPnL'] = to_json_number(self.pnl.dailyPnL)
+            stats_dict['unrealizedPnL'] = to_json_number(self.pnl.unrealizedPnL)
+            stats_dict['realizedPnL'] = to_json_number(self.pnl.realizedPnL)
+        return stats_dict
+
+    def get_positions_frame(self):
+        cols = ['symbol', 'secType', 'position', 'multiplier', 'price', 'undprice', 'delta',
+                'mkt_val', 'deltavalue', 'avgCost']
+        pdf = pd.DataFrame.from_dict(self.rows, orient='index')
+        pdf.index.name = 'conId'
+        return pdf.reindex(columns=cols)
+
+    def write_snapshot(self):
+        self.resync_totals()
+        pdf = self.get_positions_frame().reset_index()
+        snapshot = {'timestamp': datetime.now().isoformat(),
+                    'stats': self.get_stats(),
+                    'positions': json.loads(pdf.to_json(orient='records'))}
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.snapshot_path)
+        self.last_snapshot = monotonic()
+
+    def maybe_write_snapshot(self):
+        if self.last_snapshot is None or monotonic() - self.last_snapshot >= self.cadence:
+            self.write_snapshot()
+
+    def run(self, poll=1.0):
+        self.start()
+        while self.ib.isConnected():
+            self.subscribe_pending()
+            self.maybe_write_snapshot()
+            self.ib.sleep(poll)
+
+
+if __name__ == '__main__':
+    account = 'account number'
+    ib = IB()
+    ib.connect(host='127.0.0.1',
+               port=4001,
+               clientId=2,
+               timeout=4,
+               readonly=True,
+               account=account,
+               )
+    ib.reqPnL(account=account)
+    LivePortfolio(ib, account).run()
@@ -0,0 +1,140 @@
+"""
+Scenario revaluation of the report's positions frame. Each position
+is reduced to three dollar exposures (delta, gamma and vega) and each scenario
+to three factors (underlying return, its square and a vol shift in points), so
+the P&L of every position under every scenario is one matrix product, and
+sector or asset class totals are one more product with a group indicator
+matrix. P&L is the second order Taylor expansion in the underlying plus
+first order in implied vol, the same approximation as the delta value in the
+report.
+"""
+
+from time import perf_counter
+import numpy as np
+import pandas as pd
+
+PRICE_SHOCKS = np.round(np.linspace(-0.20, 0.20, 81), 4)
+VOL_SHOCKS = np.arange(-10, 31, 1.0)
+GROUP_COLUMNS = ['sector', 'Underlying Asset Class']
+
+
+def get_greek(greeks, name):
+    value = getattr(greeks, name, None)
+    return np.nan if value is None else value
+
+
+def get_exposures(pdf):
+    """
+    Dollar exposures per position as an (n, 3) array: delta dollars per unit
+    return, half the gamma dollars per unit return squared, and vega dollars
+    per vol point. Positions without greeks (stocks, futures) have a delta of
+    one and no gamma or vega. Missing values count as zero exposure.
+    """
+    greeks = pdf['greeks'] if 'greeks' in pdf else pd.Series(None, index=pdf.index)
+    gamma = np.array([get_greek(g, 'gamma') for g in greeks], dtype=float)
+    vega = np.array([get_greek(g, 'vega') for g in greeks], dtype=float)
+    units = pdf['multiplier'].values.astype(float) * pdf['position'].values.astype(float)
+    undprice = pdf['undprice'].values.astype(float)
+    delta = pdf['delta'].values.astype(float)
+    exposures = np.column_stack([units * delta * undprice,
+                                 0.5 * units * gamma * undprice ** 2,
+                                 units * vega])
+    return np.nan_to_num(exposures)
+
+
+def get_scenario_factors(price_shocks=PRICE_SHOCKS, vol_shocks=VOL_SHOCKS):
+    # (3, n_price * n_vol) factor matrix and the matching scenario index
+    px, vol = np.meshgrid(np.asarray(price_shocks, dtype=float), np.asarray(vol_shocks, dtype=float),
+                          indexing='ij')
+    factors = np.vstack([px.ravel(), px.ravel() ** 2, vol.ravel()])
+    index = pd.MultiIndex.from_arrays([px.ravel(), vol.ravel()], names=['price_shock', 'vol_shock'])
+    return factors, index
+
+
+def get_group_matrix(labels):
+    # One-hot (n_groups, n_positions) matrix, with missing labels grouped as 'Other'
+    labels = pd.Series(labels).fillna('Other').astype(str).values
+    groups, codes = np.unique(labels, return_inverse=True)
+    matrix = np.zeros((len(groups), len(labels)))
+    matrix[codes, np.arange(len(labels))] = 1.0
+    return matrix, groups
+
+
+def run_scenarios(pdf, price_shocks=PRICE_SHOCKS, vol_shocks=VOL_SHOCKS, group_cols=GROUP_COLUMNS):
+    """
+    P&L of the book for every combination of underlying return and vol shift.
+    Returns a dict with 'total' (Series indexed by price_shock, vol_shock) and
+    one DataFrame per group column (scenarios by group) for each of
+    group_cols present in pdf.
+    """
+    exposures = get_exposures(pdf)
+    factors, index = get_scenario_factors(price_shocks, vol_shocks)
+    pnl = exposures @ factors
+    results = {'total': pd.Series(pnl.sum(axis=0), index=index, name='pnl')}
+    for col in group_cols:
+        if col not in pdf:
+            continue
+        matrix, groups = get_group_matrix(pdf[col].values)
+        results[col] = pd.DataFrame((matrix @ pnl).T, index=index, columns=groups)
+    return results
+
+
+def get_scenario_grid(results):
+    # Total P&L as a price shock by vol shock table
+    return results['total'].unstack('vol_shock')
+
+
+def get_stress_summary(results, liquidation_value=None):
+    """
+    Worst and best scenario for the book and for each group, with the shocks
+    at which they occur.
+    """
+    rows = {}
+    frames = {'total': results['total'].to_frame('total')}
+    frames.update({col: df for col, df in results.items() if col != 'total'})
+    for col, df in frames.items():
+        for group in df.columns:
+            series = df[group]
+            worst, best = series.idxmin(), series.idxmax()
+            rows[(col, group)] = {'worst_pnl': series.min(),
+                                  'worst_price_shock': worst[0], 'worst_vol_shock': worst[1],
+                                  'best_pnl': series.max(),
+                                  'best_price_shock': best[0], 'best_vol_shock': best[1]}
+    summary = pd.DataFrame.from_dict(rows, orient='index')
+    summary.index.names = ['group_by', 'group']
+    if liquidation_value:
+        summary['worst_pct'] = summary['worst_pnl'] / liquidation_value
+        summary['best_pct'] = summary['best_pnl'] / liquidation_value
+    return summary
+
+
+def benchmark_scenarios(n_positions=300, n_price=101, n_vol=41, option_frac=0.5, n_runs=5, seed=None):
+    # Random book of stocks and options to time a full grid revaluation
+    rng = np.random.default_rng(seed)
+
+    class Greeks:
+        def __init__(self, delta, gamma, vega):
+            self.delta, self.gamma, self.vega = delta, gamma, vega
+
+    is_option = rng.random(n_positions) < option_frac
+    delta = np.where(is_option, rng.uniform(-1, 1, n_positions), 1.0)
+    pdf = pd.DataFrame({
+        'position': rng.integers(-50, 50, n_positions),
+        'multiplier': np.where(is_option, 100.0, 1.0),
+        'undprice': rng.uniform(20, 500, n_positions),
+        'delta': delta,
+        'greeks': [Greeks(d, g, v) if o else None
+                   for o, d, g, v in zip(is_option, delta, rng.uniform(0, 0.05, n_positions),
+                                         rng.uniform(0, 0.5, n_positions))],
+        'sector': rng.choice(['Technology', 'Healthcare', 'Energy', 'Financial Services'], n_positions),
+        'Underlying Asset Class': rng.choice(['Equity', 'Index'], n_positions),
+    })
+    price_shocks = np.linspace(-0.25, 0.25, n_price)
+    vol_shocks = np.linspace(-10, 30, n_vol)
+    times = []
+    for _ in range(n_runs):
+        start = perf_counter()
+        run_scenarios(pdf, price_shocks, vol_shocks)
+        times.append(perf_counter() - start)
+    return pd.Series({'positions': n_positions, 'scenarios': n_price * n_vol,
+                      'seconds_min': min(times), 'seconds_mean': np.mean(times)})
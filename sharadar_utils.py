@@ -0,0 +1,162 @@
+"""
+Local reference store for the SHARADAR/TICKERS table. Rows are kept in a
+SQLite file indexed by ticker and permaticker and refreshed at most once a day
+by downloading only the rows updated since the last refresh. Lookups go
+through a per-process copy of the table, so the report and the ETF scripts
+read it once per run instead of downloading the table or parsing the CSV on
+every call.
+"""
+
+from datetime import date
+import os
+from os.path import join
+from pathlib import Path
+import sqlite3
+import nasdaqdatalink as nq
+import pandas as pd
+
+REFERENCE_PATH = join(Path.home(), '.zipline', 'custom_data', 'sharadar_tickers.sqlite')
+TICKERS_CSV_PATH = join(Path.home(), '.zipline', 'custom_data', 'SHARADAR_TICKERS.csv')
+TICKER_COLUMNS = ['sharadar_table', 'permaticker', 'ticker', 'name', 'exchange', 'isdelisted',
+                  'category', 'cusips', 'sector', 'industry', 'lastupdated']
+
+# Per store path: (last refresh, all rows indexed by ticker, one row per ticker, CSV mtime read)
+_tickers_cache = {}
+
+
+def connect_store(path=REFERENCE_PATH):
+    fdir = os.path.dirname(path)
+    if fdir and not os.path.isdir(fdir):
+        os.makedirs(fdir)
+    con = sqlite3.connect(path)
+    con.execute('CREATE TABLE IF NOT EXISTS tickers ({}, PRIMARY KEY (sharadar_table, permaticker))'.format(
+        ', '.join(TICKER_COLUMNS)))
+    con.execute('CREATE INDEX IF NOT EXISTS tickers_ticker ON tickers (ticker)')
+    con.execute('CREATE INDEX IF NOT EXISTS tickers_permaticker ON tickers (permaticker)')
+    con.execute('CREATE TABLE IF NOT EXISTS meta (key PRIMARY KEY, value)')
+    return con
+
+
+def get_meta(con, key):
+    row = con.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return None if row is None else row[0]
+
+
+def set_meta(con, key, value):
+    con.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+
+def to_store_rows(df):
+    df = df.rename(columns={'table': 'sharadar_table'}).reindex(columns=TICKER_COLUMNS)
+    df['lastupdated'] = pd.to_datetime(df['lastupdated']).dt.strftime('%Y-%m-%d')
+    df['permaticker'] = pd.to_numeric(df['permaticker'])
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+
+def upsert_tickers(con, df):
+    con.executemany('INSERT OR REPLACE INTO tickers ({}) VALUES ({})'.format(
+        ', '.join(TICKER_COLUMNS), ', '.join('?' * len(TICKER_COLUMNS))), to_store_rows(df))
+
+
+def refresh_reference(api_key=None, path=REFERENCE_PATH, csv_path=TICKERS_CSV_PATH, force=False):
+    """
+    Brings the store up to date. The local SHARADAR_TICKERS.csv, when there
+    is one, is loaded into an empty store and upserted again whenever it is
+    replaced by a file at least as recent as the last refresh, so the store
+    follows the CSV without an API key. With a key, only rows with
+    lastupdated on or after the newest stored date are downloaded, at most
+    once per day unless force is set, or the full table for an empty store.
+    """
+    today = date.today().isoformat()
+    con = connect_store(path)
+    try:
+        count = con.execute('SELECT COUNT(*) FROM tickers').fetchone()[0]
+        if os.path.isfile(csv_path):
+            csv_mtime = os.path.getmtime(csv_path)
+            csv_day = date.fromtimestamp(csv_mtime).isoformat()
+            refreshed = get_meta(con, 'refreshed')
+            if csv_mtime != get_meta(con, 'csv_mtime') and (count == 0 or refreshed is None
+                                                              or csv_day >= refreshed):
+                upsert_tickers(con, pd.read_csv(csv_path))
+                set_meta(con, 'refreshed', max(csv_day, refreshed or csv_day))
+                set_meta(con, 'csv_mtime', csv_mtime)
+                con.commit()
+                count = con.execute('SELECT COUNT(*) FROM tickers').fetchone()[0]
+        if api_key is None or (get_meta(con, 'refreshed') == today and not force):
+            return count
+        if count == 0:
+            df = nq.get_table('SHARADAR/TICKERS', paginate=True, api_key=api_key)
+        else:
+            # Rows can be restated on the day of the newest update, so it is fetched again
+            newest = con.execute('SELECT MAX(lastupdated) FROM tickers').fetchone()[0]
+            df = nq.get_table('SHARADAR/TICKERS', lastupdated={'gte': newest},
+                              paginate=True, api_key=api_key)
+        if len(df):
+            upsert_tickers(con, df)
+        set_meta(con, 'refreshed', today)
+        con.commit()
+        return con.execute('SELECT COUNT(*) FROM tickers').fetchone()[0]
+    finally:
+        con.close()
+
+
+def get_csv_mtime(csv_path=TICKERS_CSV_PATH):
+    return os.path.getmtime(csv_path) if os.path.isfile(csv_path) else None
+
+
+def load_reference(api_key=None, path=REFERENCE_PATH):
+    # Reloaded from disk only when the store has been refreshed or the CSV replaced since the last read
+    cached = _tickers_cache.get(path)
+    if (cached is not None and cached[3] == get_csv_mtime()
+            and (api_key is None or cached[0] == date.today().isoformat())):
+        return cached
+    csv_mtime = get_csv_mtime()
+    refresh_reference(api_key, path)
+    con = connect_store(path)
+    try:
+        refreshed = get_meta(con, 'refreshed')
+        df = pd.read_sql('SELECT * FROM tickers', con)
+    finally:
+        con.close()
+    # Active listings first, so the first row per ticker is the current one
+    df = df.sort_values(['ticker', 'isdelisted', 'lastupdated'], ascending=[True, True, False])
+    df = df.set_index('ticker', drop=False)
+    unique = df[~df.index.duplicated(keep='first')]
+    _tickers_cache[path] = (refreshed, df, unique, csv_mtime)
+    return _tickers_cache[path]
+
+
+def get_reference_table(api_key=None, path=REFERENCE_PATH):
+    return load_reference(api_key, path)[1]
+
+
+def get_sec_ind_table(api_key=None, path=REFERENCE_PATH):
+    # One row per ticker, in the layout of get_full_nasdaq_sec_ind_table
+    unique = load_reference(api_key, path)[2]
+    return unique[['ticker', 'sector', 'industry']].reset_index(drop=True)
+
+
+def get_sec_ind(symbols, api_key=None, path=REFERENCE_PATH):
+    # Sector and industry for the given symbols, indexed by symbol
+    unique = load_reference(api_key, path)[2]
+    secind = unique.reindex([x for x in symbols if x in unique.index])[['sector', 'industry']]
+    secind.index.name = 'symbol'
+    return secind
+
+
+def get_tinfo(path=REFERENCE_PATH):
+    # Active ticker to permaticker map used when tagging ETF holdings
+    tinfo = get_reference_table(path=path)
+    tinfo = tinfo[['permaticker', 'ticker', 'name', 'exchange', 'isdelisted', 'category', 'cusips']]
+    tinfo = tinfo.dropna()
+    tinfo = tinfo[tinfo.isdelisted == 'N']
+    tinfo = tinfo[['ticker', 'permaticker']].drop_duplicates()
+    return tinfo.reset_index(drop=True)
+
+
+def get_permaticker(ticker, path=REFERENCE_PATH):
+    unique = load_reference(path=path)[2]
+    if ticker not in unique.index:
+        return None
+    row = unique.loc[ticker]
+    return None if row['isdelisted'] != 'N' else int(row['permaticker'])
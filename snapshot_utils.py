@@ -0,0 +1,88 @@
+"""
+Columnar snapshots for the portfolio report. Each output frame is written to
+Parquet with a timestamped history plus a latest copy, and reference sheets in
+the research workbook are read through a Parquet cache that is invalidated
+when the workbook's mtime changes.
+"""
+
+from datetime import datetime
+import json
+import os
+from os.path import join
+import shutil
+import openpyxl
+import pandas as pd
+
+SNAPSHOT_PATH = join('Portfolio', 'snapshots')
+SHEET_CACHE_PATH = join('Portfolio', 'sheet_cache')
+
+
+def to_columnar(df):
+    # Parquet needs one type per column, so mixed object columns become strings
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[col], skipna=True) in ['mixed', 'mixed-integer']:
+            df[col] = df[col].map(lambda x: x if x is None else str(x))
+    return df
+
+
+def save_snapshot(df, name, snapshot_path=SNAPSHOT_PATH, timestamp=None):
+    if timestamp is None:
+        timestamp = datetime.now()
+    fpath = join(snapshot_path, name)
+    if not os.path.isdir(fpath):
+        os.makedirs(fpath)
+    history_file = join(fpath, '{}_{}.parquet'.format(name, timestamp.strftime('%Y%m%d_%H%M%S')))
+    to_columnar(df).to_parquet(history_file)
+    shutil.copyfile(history_file, join(fpath, '{}_latest.parquet'.format(name)))
+    return history_file
+
+
+def save_snapshots(outputs, snapshot_path=SNAPSHOT_PATH):
+    timestamp = datetime.now()
+    for name, df in outputs.items():
+        save_snapshot(df, name, snapshot_path, timestamp)
+
+
+def read_snapshot(name, snapshot_path=SNAPSHOT_PATH, timestamp=None):
+    if timestamp is None:
+        return pd.read_parquet(join(snapshot_path, name, '{}_latest.parquet'.format(name)))
+    return pd.read_parquet(join(snapshot_path, name, '{}_{}.parquet'.format(
+        name, timestamp.strftime('%Y%m%d_%H%M%S'))))
+
+
+def read_sheet(xlsx_path, sheet_name):
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True)
+    try:
+        df = pd.DataFrame(wb[sheet_name].values)
+    finally:
+        wb.close()
+    # Columns with a blank header (often just formatted cells) would all be
+    # named 'None', which Parquet rejects as duplicates, so they are dropped
+    header = df.iloc[0]
+    keep = [not (pd.isna(h) or (isinstance(h, str) and not h.strip())) for h in header.values]
+    df = df.loc[:, keep]
+    df.columns = header[keep].values
+    return df[1:].reset_index(drop=True)
+
+
+def read_sheet_cached(xlsx_path, sheet_name, cache_path=SHEET_CACHE_PATH):
+    cache_name = sheet_name.replace(' ', '_')
+    cache_file = join(cache_path, '{}.parquet'.format(cache_name))
+    meta_file = join(cache_path, '{}.json'.format(cache_name))
+    mtime = os.path.getmtime(xlsx_path)
+    if os.path.isfile(cache_file) and os.path.isfile(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta['source'] == os.path.abspath(xlsx_path) and meta['mtime'] == mtime:
+            return pd.read_parquet(cache_file)
+
+    df = to_columnar(read_sheet(xlsx_path, sheet_name))
+    if not os.path.isdir(cache_path):
+        os.makedirs(cache_path)
+    df.to_parquet(cache_file)
+    with open(meta_file, 'w') as f:
+        json.dump({'source': os.path.abspath(xlsx_path), 'mtime': mtime}, f)
+    # Read back so a cold cache returns the same dtypes as a warm one
+    return pd.read_parquet(cache_file)
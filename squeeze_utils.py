@@ -0,0 +1,128 @@
+"""
+Client for the SqueezeMetrics yachtclub CSV endpoints. Requests share one
+pooled session, responses are kept on disk with their ETag and Last-Modified
+headers, and a cached copy younger than the TTL is used without touching the
+network. Older copies are revalidated with a conditional request, so an
+unchanged GEX+ history costs a 304 rather than a full download. Each body is
+parsed once per process.
+"""
+
+from datetime import datetime
+import json
+import os
+from os.path import join
+from io import StringIO
+from time import time
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = 'https://squeezemetrics.com/monitor/api/yachtclub'
+CACHE_PATH = join('Portfolio', 'squeeze_cache')
+CACHE_TTL = 6 * 3600
+
+# Shared clients by (apikey, base_url, cache_path)
+_clients = {}
+
+
+class SqueezeMetricsClient:
+    def __init__(self, apikey, base_url=BASE_URL, cache_path=CACHE_PATH, ttl=CACHE_TTL,
+                 timeout=30, session=None):
+        self.apikey = apikey
+        self.base_url = base_url.rstrip('/')
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=3))
+            session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=3))
+        self.session = session
+        # Parsed frames by endpoint, as (body mtime, DataFrame)
+        self.frames = {}
+
+    def cache_files(self, endpoint):
+        return join(self.cache_path, endpoint + '.csv'), join(self.cache_path, endpoint + '.json')
+
+    def read_meta(self, endpoint):
+        body_file, meta_file = self.cache_files(endpoint)
+        if not (os.path.isfile(body_file) and os.path.isfile(meta_file)):
+            return None
+        with open(meta_file) as f:
+            return json.load(f)
+
+    def write_cache(self, endpoint, meta, body=None):
+        body_file, meta_file = self.cache_files(endpoint)
+        if not os.path.isdir(self.cache_path):
+            os.makedirs(self.cache_path)
+        if body is not None:
+            with open(body_file + '.tmp', 'wb') as f:
+                f.write(body)
+            os.replace(body_file + '.tmp', body_file)
+        with open(meta_file + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_file + '.tmp', meta_file)
+
+    def fetch(self, endpoint, force=False):
+        """
+        Makes sure the cached body for endpoint is current and returns the
+        path to it. Returns straight away when the copy is within the TTL,
+        otherwise sends the stored validators and only rewrites the body on
+        a 200.
+        """
+        body_file, _ = self.cache_files(endpoint)
+        meta = self.read_meta(endpoint)
+        if meta is not None and not force and time() - meta['checked'] < self.ttl:
+            return body_file
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        resp = self.session.get('{}/{}'.format(self.base_url, endpoint), params={'key': self.apikey},
+                                headers=headers, timeout=self.timeout)
+        if resp.status_code == 304 and meta is not None:
+            meta['checked'] = time()
+            self.write_cache(endpoint, meta)
+            return body_file
+        resp.raise_for_status()
+        meta = {'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+                'checked': time(),
+                'downloaded': datetime.now().isoformat()}
+        self.write_cache(endpoint, meta, resp.content)
+        return body_file
+
+    def get(self, endpoint, force=False):
+        body_file = self.fetch(endpoint, force)
+        mtime = os.path.getmtime(body_file)
+        cached = self.frames.get(endpoint)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(body_file, 'rb') as f:
+            df = pd.read_csv(StringIO(f.read().decode('utf-8')))
+        self.frames[endpoint] = (mtime, df)
+        return df
+
+    def get_gexplus(self, force=False):
+        return self.get('gexplus', force)
+
+    def get_sumo(self, force=False):
+        return self.get('sumo', force)
+
+
+def get_client(apikey, base_url=BASE_URL, cache_path=CACHE_PATH, ttl=CACHE_TTL):
+    key = (str(apikey), base_url, cache_path)
+    if key not in _clients:
+        _clients[key] = SqueezeMetricsClient(apikey, base_url, cache_path, ttl)
+    return _clients[key]
+
+
+def get_gexplus(apikey, **kwargs):
+    return get_client(apikey, **kwargs).get_gexplus()
+
+
+def get_sumo(apikey, **kwargs):
+    return get_client(apikey, **kwargs).get_sumo()
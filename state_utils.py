@@ -0,0 +1,127 @@
+"""
+Compact storage for the live algorithm's predictions in redis. preds_df is kept
+under its own hash as one raw NumPy buffer per column plus a content version
+stamp, so readers fetch only the columns they need and skip the reload when
+nothing has changed, instead of downloading and unpickling the whole
+pylivetrader state. A small counter next to the state key says when the
+state, and so the published predictions, are out of date.
+"""
+
+from datetime import datetime
+import hashlib
+import json
+import pickle
+import numpy as np
+import pandas as pd
+
+STATE_KEY = 'pylivetrader_redis_state'
+PREDS_KEY = 'preds_df'
+
+# Last frame read per key, as (version, DataFrame). Buffers are raw bytes, so
+# the redis client must not be created with decode_responses=True.
+_preds_cache = {}
+
+
+def save_preds(r, preds_df, key=PREDS_KEY, state_version=None):
+    preds_df = preds_df.select_dtypes('number')
+    index = json.dumps([str(getattr(asset, 'symbol', asset)) for asset in preds_df.index])
+    columns = [str(col) for col in preds_df.columns]
+    fields = {'index': index, 'columns': json.dumps(columns)}
+    digest = hashlib.sha1(index.encode())
+    for col, name in zip(preds_df.columns, columns):
+        values = np.ascontiguousarray(preds_df[col].values)
+        fields['dtype:' + name] = values.dtype.str
+        fields['data:' + name] = values.tobytes()
+        digest.update(name.encode() + values.dtype.str.encode() + fields['data:' + name])
+    version = digest.hexdigest()
+    if r.hget(key, 'version') == version.encode():
+        if state_version is not None:
+            r.hset(key, 'state_version', state_version)
+        return version
+    fields['version'] = version
+    fields['updated'] = datetime.now().isoformat()
+    if state_version is not None:
+        fields['state_version'] = state_version
+    pipe = r.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping=fields)
+    pipe.execute()
+    return version
+
+
+def load_preds(r, columns=None, key=PREDS_KEY):
+    version, stored_columns = r.hmget(key, ['version', 'columns'])
+    if version is None:
+        raise KeyError('No predictions stored under {}'.format(key))
+    stored_columns = json.loads(stored_columns)
+    wanted = stored_columns if columns is None else list(columns)
+    cached = _preds_cache.get(key)
+    if cached is not None and cached[0] != version:
+        cached = None
+    if cached is not None and set(wanted) <= set(cached[1].columns):
+        return cached[1][wanted]
+
+    # Only the columns not already cached for this version are fetched
+    fetch = [col for col in wanted if cached is None or col not in cached[1].columns]
+    fields = ['version', 'index'] + ['dtype:' + col for col in fetch] + ['data:' + col for col in fetch]
+    values = r.hmget(key, fields)
+    if values[0] != version:
+        # Rewritten between the two reads, start again from the new version
+        return load_preds(r, columns, key)
+    dtypes = values[2:2 + len(fetch)]
+    buffers = values[2 + len(fetch):]
+    missing = [col for col, buf in zip(fetch, buffers) if buf is None]
+    if missing:
+        raise KeyError('Columns {} not stored under {}'.format(missing, key))
+    data = {col: np.frombuffer(buf, dtype=np.dtype(dtype.decode())).copy()
+            for col, dtype, buf in zip(fetch, dtypes, buffers)}
+    preds_df = pd.DataFrame(data, index=json.loads(values[1]))
+    if cached is not None:
+        preds_df = pd.concat([cached[1], preds_df], axis=1)
+    _preds_cache[key] = (version, preds_df)
+    return preds_df[wanted]
+
+
+def get_state_version_key(state_key=STATE_KEY):
+    return state_key + ':version'
+
+
+def save_state(r, state, state_key=STATE_KEY, key=PREDS_KEY):
+    """
+    Writes the pickled algorithm state and bumps its version counter in one
+    transaction, then publishes its preds_df stamped with that version. The
+    algorithm side calls this wherever it used to set the state key directly.
+    """
+    pipe = r.pipeline()
+    pipe.set(state_key, pickle.dumps(state))
+    pipe.incr(get_state_version_key(state_key))
+    state_version = pipe.execute()[1]
+    save_preds(r, state['preds_df'], key, state_version)
+    return state_version
+
+
+def publish_preds_from_state(r, state_key=STATE_KEY, key=PREDS_KEY):
+    # Copy of preds_df out of the pickled state, stamped with the state's version
+    pipe = r.pipeline()
+    pipe.get(get_state_version_key(state_key))
+    pipe.get(state_key)
+    state_version, state_blob = pipe.execute()
+    if state_blob is None:
+        return
+    save_preds(r, pickle.loads(state_blob)['preds_df'], key, state_version)
+
+
+def get_preds(r, columns=None, key=PREDS_KEY, state_key=STATE_KEY):
+    """
+    Reads predictions from the compact key. The state blob is only fetched
+    and unpickled when there are no predictions yet or the state's version
+    counter has moved past the one they were published from. Without a
+    counter, the compact key is treated as the source of truth.
+    """
+    pipe = r.pipeline(transaction=False)
+    pipe.get(get_state_version_key(state_key))
+    pipe.hmget(key, ['version', 'state_version'])
+    state_version, (version, published_version) = pipe.execute()
+    if version is None or (state_version is not None and state_version != published_version):
+        publish_preds_from_state(r, state_key, key)
+    return load_preds(r, columns, key)
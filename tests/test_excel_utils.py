@@ -0,0 +1,31 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+openpyxl = pytest.importorskip('openpyxl')
+
+from excel_utils import write_df_excel, replace_table
+
+
+def test_nan_overwrites_existing_value():
+    sheet = openpyxl.Workbook().active
+    write_df_excel(pd.DataFrame({'a': [1, 3]}), 'A', 1, sheet, include_cols=True)
+    write_df_excel(pd.DataFrame({'a': [1, np.nan]}), 'A', 1, sheet, include_cols=True)
+    assert sheet['A3'].value is None
+
+
+def test_diff_write_clears_cell():
+    sheet = openpyxl.Workbook().active
+    write_df_excel(pd.DataFrame({'a': [1, 3]}), 'A', 1, sheet)
+    write_df_excel(pd.DataFrame({'a': [1, np.nan]}), 'A', 1, sheet, diff=True)
+    assert sheet['A1'].value == 1
+    assert sheet['A2'].value is None
+
+
+def test_replace_table_clears_missing_values():
+    sheet = openpyxl.Workbook().active
+    replace_table(sheet, pd.DataFrame({'a': [1, 3], 'b': ['x', 'y']}), 'Data')
+    replace_table(sheet, pd.DataFrame({'a': [1, np.nan], 'b': ['x', None]}), 'Data')
+    assert sheet['A3'].value is None
+    assert sheet['B3'].value is None
+    assert sheet.tables['Data'].ref == 'A1:B3'
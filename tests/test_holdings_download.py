@@ -0,0 +1,93 @@
+import io
+import logging
+import os
+import pytest
+
+pytest.importorskip('requests')
+openpyxl = pytest.importorskip('openpyxl')
+
+from holdings_download import (ISHARES_PRODUCTS, SPDR_TICKERS, check_content, download_holdings,
+                               find_new_download, get_raw_file, get_sources, make_session)
+
+ISHARES_CSV = (b'iShares Russell 2000 ETF\n'
+               b'Fund Holdings as of,"Jan 05, 2024"\n'
+               b'\xc2\xa0\n'
+               b'Ticker,Name,Sector,Market Value,Weight (%)\n'
+               b'"AAA","AAA INC","Tech","1,000.00","60.00"\n'
+               b'"BBB","BBB INC","Energy","666.67","40.00"\n')
+ERROR_PAGE = b'<!DOCTYPE html><html><body>Service unavailable</body></html>'
+
+
+def make_spdr_xlsx(ticker):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['Fund Name:', ticker.upper()])
+    ws.append(['Holdings:', 'As of 05-Jan-2024'])
+    ws.append([])
+    ws.append(['Name', 'Ticker', 'Identifier', 'SEDOL', 'Weight', 'Sector', 'Shares Held', 'Local Currency'])
+    ws.append(['AAA INC', 'AAA', '000000000', '0000000', 60.0, 'Tech', 100, 'USD'])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def spdr_files():
+    return {ticker: make_spdr_xlsx(ticker) for ticker in SPDR_TICKERS}
+
+
+@pytest.fixture
+def holdings_server(stub_server, spdr_files):
+    for etf, product in ISHARES_PRODUCTS.items():
+        stub_server.routes['/ishares/{}/{}'.format(product, etf.upper())] = (
+            200, {'Content-Type': 'text/csv'}, ISHARES_CSV)
+    for ticker, content in spdr_files.items():
+        stub_server.routes['/spdr/{}.xlsx'.format(ticker)] = (200, {}, content)
+    # An html error page served with a 200 and a plain 404
+    stub_server.routes['/ishares/{}/IWB'.format(ISHARES_PRODUCTS['iwb'])] = (200, {}, ERROR_PAGE)
+    stub_server.routes['/spdr/xlk.xlsx'] = (200, {}, ERROR_PAGE)
+    del stub_server.routes['/spdr/xlu.xlsx']
+    return stub_server
+
+
+def test_download_holdings_from_stub_server(holdings_server, spdr_files, tmp_path, caplog):
+    sources = get_sources(ishares_url=holdings_server.url + '/ishares/{}/{}',
+                          spdr_url=holdings_server.url + '/spdr/{}.xlsx')
+    raw_path = str(tmp_path)
+    with caplog.at_level(logging.WARNING):
+        paths = download_holdings(sources, raw_path=raw_path, session=make_session(retries=0),
+                                  browser_fallback=False)
+
+    failed = {'iwb', 'xlk', 'xlu'}
+    assert set(paths) == set(sources) - failed
+    for etf, fname in paths.items():
+        assert fname == get_raw_file(etf, sources[etf].ext, raw_path)
+        with open(fname, 'rb') as f:
+            content = f.read()
+        assert content == (ISHARES_CSV if etf in ISHARES_PRODUCTS else spdr_files[etf])
+    for etf in failed:
+        assert not os.path.exists(get_raw_file(etf, sources[etf].ext, raw_path))
+        assert 'Download failed for {}'.format(etf) in caplog.text
+    # iShares files are requested with a POST, SPDR files with a GET
+    methods = {path: method for method, path, _ in holdings_server.requests}
+    assert methods['/ishares/{}/IWM'.format(ISHARES_PRODUCTS['iwm'])] == 'POST'
+    assert methods['/spdr/spy.xlsx'] == 'GET'
+
+
+def test_check_content_rejects_error_pages():
+    assert check_content(ISHARES_CSV, 'csv')
+    assert not check_content(ERROR_PAGE, 'csv')
+    assert not check_content(b'  <html><body>error</body></html>', 'csv')
+    assert not check_content(b'', 'csv')
+    assert check_content(make_spdr_xlsx('spy'), 'xlsx')
+    assert not check_content(ERROR_PAGE, 'xlsx')
+
+
+def test_new_download_found_by_elimination(tmp_path):
+    (tmp_path / 'old.csv').write_bytes(b'a')
+    seen = set(os.listdir(tmp_path))
+    assert find_new_download(str(tmp_path), seen) is None
+    (tmp_path / 'IWV_holdings.csv.crdownload').write_bytes(b'b')
+    assert find_new_download(str(tmp_path), seen) is None
+    os.replace(tmp_path / 'IWV_holdings.csv.crdownload', tmp_path / 'IWV_holdings.csv')
+    assert find_new_download(str(tmp_path), seen) == 'IWV_holdings.csv'
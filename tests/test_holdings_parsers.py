@@ -0,0 +1,53 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+openpyxl = pytest.importorskip('openpyxl')
+
+from holdings_parsers import parse_ishares_csv, parse_spdr_xlsx
+
+ISHARES_CSV = (b'\xef\xbb\xbfiShares Russell 2000 ETF\n'
+               b'Fund Holdings as of,"Jan 05, 2024"\n'
+               b'\xc2\xa0\n'
+               b'Ticker,Name,Market Value,Weight (%)\n'
+               b'"AAA","AAA INC","1,000.00","60.00"\n'
+               b'"BBB","BBB INC","666.67","40.00"\n'
+               b'\xc2\xa0\n'
+               b'"The content contained herein is owned or licensed by BlackRock"\n')
+
+
+def test_parse_ishares_csv():
+    hdate, df = parse_ishares_csv(ISHARES_CSV)
+    assert hdate == '2024-01-05'
+    assert df['ticker'].tolist() == ['AAA', 'BBB']
+    assert df['market value'].tolist() == [1000.0, 666.67]
+
+
+def test_ishares_csv_without_date_is_rejected():
+    content = ISHARES_CSV.replace(b'Fund Holdings as of,"Jan 05, 2024"\n', b'')
+    with pytest.raises(ValueError, match='holdings date'):
+        parse_ishares_csv(content)
+
+
+def make_spdr_xlsx(path, as_of=True):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['Fund Name:', 'SPDR S&P 500 ETF Trust'])
+    ws.append(['Holdings:', 'As of 05-Jan-2024' if as_of else 'Daily holdings'])
+    ws.append([])
+    ws.append(['Name', 'Ticker', 'Identifier', 'SEDOL', 'Weight', 'Sector', 'Shares Held', 'Local Currency'])
+    ws.append(['AAA INC', 'AAA', '000000000', '0000000', 60.0, 'Tech', 100, 'USD'])
+    ws.append(['BBB INC', 'BBB', '000000001', '0000001', 40.0, 'Energy', 50, 'USD'])
+    wb.save(path)
+    return str(path)
+
+
+def test_parse_spdr_xlsx(tmp_path):
+    hdate, df = parse_spdr_xlsx(make_spdr_xlsx(tmp_path / 'spy.xlsx'))
+    assert hdate == '2024-01-05'
+    assert df['ticker'].tolist() == ['AAA', 'BBB']
+    assert df['weight'].tolist() == [60.0, 40.0]
+
+
+def test_spdr_xlsx_without_date_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match='holdings date'):
+        parse_spdr_xlsx(make_spdr_xlsx(tmp_path / 'spy.xlsx', as_of=False))
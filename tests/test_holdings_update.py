@@ -0,0 +1,36 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+from constituents_store import get_dates
+from holdings_update import update_holdings
+
+
+def write_daily(cpath, etf, fdate, values):
+    epath = cpath / etf
+    epath.mkdir(parents=True, exist_ok=True)
+    df = pd.DataFrame({'ticker': list(values), 'market value': list(values.values()),
+                       'permaticker': [100 + i for i in range(len(values))]})
+    df.to_csv(epath / '{}_{}.csv'.format(etf, fdate))
+
+
+def test_update_keeps_wide_csv_current(tmp_path):
+    cpath, store_path, fundamentals_path = tmp_path / 'constituents', tmp_path / 'store', tmp_path / 'fund'
+    fundamentals_path.mkdir()
+    legacy = pd.DataFrame({100.0: [0.5], 101.0: [0.5]}, index=pd.to_datetime(['2024-01-02']))
+    legacy.to_csv(fundamentals_path / 'iwm_constits.csv')
+    write_daily(cpath, 'iwm', '2024-01-03', {'AAA': 300.0, 'BBB': 100.0})
+
+    counts = update_holdings(str(cpath), str(store_path), str(fundamentals_path), max_workers=1)
+    assert counts == {'iwm': 1}
+    assert get_dates('iwm', str(store_path)) == ['2024-01-02', '2024-01-03']
+    wide = pd.read_csv(fundamentals_path / 'iwm_constits.csv', index_col=0)
+    assert list(wide.columns.astype(float)) == [100.0, 101.0]
+    assert wide.loc['2024-01-03'].tolist() == [0.75, 0.25]
+
+    write_daily(cpath, 'iwm', '2024-01-04', {'AAA': 100.0, 'BBB': 100.0, 'CCC': 200.0})
+    update_holdings(str(cpath), str(store_path), str(fundamentals_path), max_workers=1)
+    wide = pd.read_csv(fundamentals_path / 'iwm_constits.csv', index_col=0)
+    assert list(wide.index) == ['2024-01-02', '2024-01-03', '2024-01-04']
+    assert wide.loc['2024-01-04'].tolist() == [0.25, 0.25, 0.5]
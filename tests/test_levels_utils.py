@@ -0,0 +1,55 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from levels_utils import BAND_MULTS, LEVEL_COLUMNS, STATE_FILE, STD_WINDOW, WINDOWS, RollingLevels
+
+
+def pandas_levels(bars):
+    # Reference implementation over the whole history with pandas rolling windows
+    df = bars.copy()
+    for w in WINDOWS:
+        df['SMA{}'.format(w)] = df.close.rolling(w).mean()
+    vol = df.close.rolling(STD_WINDOW).std()
+    sma = df.close.rolling(STD_WINDOW).mean()
+    for key, mult in BAND_MULTS.items():
+        df['upper{}_{}'.format(STD_WINDOW, key)] = sma + vol * mult
+        df['lower{}_{}'.format(STD_WINDOW, key)] = sma - vol * mult
+    df['ylow'] = df.iloc[-1]['low']
+    df['yhigh'] = df.iloc[-1]['high']
+    return df[LEVEL_COLUMNS].iloc[-1]
+
+
+def make_bars(n_bars, n_symbols, seed):
+    rng = np.random.default_rng(seed)
+    bars_by_symbol = {}
+    for i in range(n_symbols):
+        n = n_bars - 7 * i
+        close = 4000 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        bars_by_symbol['SYM{}'.format(i)] = pd.DataFrame({
+            'date': pd.bdate_range('2020-01-01', periods=n),
+            'open': close, 'high': close * 1.01, 'low': close * 0.99, 'close': close, 'volume': 0})
+    return bars_by_symbol
+
+
+@pytest.mark.parametrize('n_bars, n_symbols, n_new', [(400, 5, 30), (260, 3, 5)])
+def test_incremental_levels_match_pandas(tmp_path, n_bars, n_symbols, n_new):
+    # The state is built from the first part of each history, saved and
+    # reloaded, then fed the rest one bar at a time with the last bar
+    # restated once, as happens during a daily update
+    bars_by_symbol = make_bars(n_bars, n_symbols, seed=n_bars)
+    state = RollingLevels.from_bars({s: bars.iloc[:-n_new] for s, bars in bars_by_symbol.items()})
+    fname = str(tmp_path / STATE_FILE)
+    state.save(fname)
+    state = RollingLevels.load(fname)
+    for symbol, bars in bars_by_symbol.items():
+        rest = bars.iloc[-n_new:]
+        restated = rest.iloc[[-1]].assign(close=rest['close'].iloc[-1] * 0.9)
+        state.add_bars(symbol, pd.concat([rest.iloc[:-1], restated, rest.iloc[[-1]]]))
+
+    levels = state.levels()[LEVEL_COLUMNS].astype(float)
+    expected = pd.DataFrame({s: pandas_levels(bars) for s, bars in bars_by_symbol.items()}).T
+    expected = expected[LEVEL_COLUMNS].astype(float)
+    assert list(levels.index) == list(expected.index)
+    np.testing.assert_allclose(levels.values, expected.values, rtol=1e-9)
@@ -0,0 +1,47 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+pytest.importorskip('cvxpy')
+
+from covariance_utils import sample_cov
+from optimizer_utils import NativeSolver, check_native_solver
+
+N_ASSETS = 80
+GAMMA_VALS = np.logspace(-2, 3, num=40)
+
+
+def make_problem(kind, seed=0):
+    rng = np.random.default_rng(seed)
+    mu = rng.normal(0, 0.01, N_ASSETS)
+    if kind == 'factor':
+        F = rng.normal(0, 0.02, (N_ASSETS, 3))
+        d = rng.uniform(1e-4, 4e-4, N_ASSETS)
+        return mu, (F, d)
+    # 25 days of returns, as in portfolio_optimizer, give a singular sample covariance
+    n_obs = 25 if kind == 'singular' else 250
+    return mu, sample_cov(pd.DataFrame(rng.normal(0, 0.02, (n_obs, N_ASSETS))))
+
+
+@pytest.mark.parametrize('kind', ['full', 'singular', 'factor'])
+@pytest.mark.parametrize('constraints', [{}, {'net': 0.3, 'gross': 1.0, 'bound': 0.05},
+                                         {'net': 0.0, 'gross': 2.0, 'bound': 0.1}])
+def test_native_solver_matches_cvxpy(kind, constraints):
+    mu, sigma = make_problem(kind)
+    report = check_native_solver(mu, sigma, gamma_vals=GAMMA_VALS, **constraints)
+    assert len(report) == len(GAMMA_VALS)
+    assert report['within_tol'].all(), report[~report['within_tol']]
+
+
+def test_native_solver_needs_no_fallback():
+    mu, sigma = make_problem('singular')
+    solver = NativeSolver(mu, sigma)
+    for gamma_val in GAMMA_VALS:
+        solver.solve(gamma_val)
+    assert solver.n_fallbacks == 0
+
+
+def test_native_solver_rejects_infeasible_constraints():
+    mu, sigma = make_problem('full')
+    with pytest.raises(ValueError):
+        NativeSolver(mu, sigma, net=0.5, gross=1.0, bound=0.005)
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from polygon_utils import get_bars
+
+
+class FakePolygon:
+    def __init__(self):
+        self.close = 100.0
+        self.calls = []
+
+    def historic_agg_v2(self, symbol, multiplier, timespan, _from, to):
+        self.calls.append((_from, to))
+        index = pd.date_range(_from, to, freq='D')
+        return SimpleNamespace(df=pd.DataFrame({'close': self.close}, index=index))
+
+
+def test_partial_day_is_refetched(tmp_path):
+    polygon = FakePolygon()
+    api = SimpleNamespace(polygon=polygon)
+    today = datetime.today()
+    start = (today - timedelta(days=5)).strftime('%Y-%m-%d')
+    end = today.strftime('%Y-%m-%d')
+    get_bars(api, 'AAA', start, end, cache_path=str(tmp_path))
+    polygon.close = 101.0
+    bars = get_bars(api, 'AAA', start, end, cache_path=str(tmp_path))
+    assert polygon.calls[-1] == (end, end)
+    assert bars['close'].iloc[-1] == 101.0
+    assert bars['close'].iloc[0] == 100.0
+
+
+def test_final_days_are_served_from_cache(tmp_path):
+    polygon = FakePolygon()
+    api = SimpleNamespace(polygon=polygon)
+    get_bars(api, 'AAA', '2020-01-01', '2020-01-10', cache_path=str(tmp_path))
+    bars = get_bars(api, 'AAA', '2020-01-02', '2020-01-10', cache_path=str(tmp_path))
+    assert len(polygon.calls) == 1
+    assert len(bars) == 9
@@ -0,0 +1,111 @@
+import json
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('ib_insync')
+
+import portfolio_service
+from portfolio_service import LivePortfolio
+
+ACCOUNT = 'DU123'
+
+
+class FakeEvent:
+    def __init__(self):
+        self.handlers = []
+
+    def __iadd__(self, handler):
+        self.handlers.append(handler)
+        return self
+
+    def emit(self, *args):
+        for handler in self.handlers:
+            handler(*args)
+
+
+class FakeTicker:
+    def __init__(self, contract, price=None):
+        self.contract = contract
+        self.price = price
+        self.askGreeks = None
+
+    def marketPrice(self):
+        return self.price
+
+
+class FakeIB:
+    """Event source with the parts of ib_insync.IB that LivePortfolio uses."""
+
+    def __init__(self, positions=(), account_values=()):
+        self.pendingTickersEvent = FakeEvent()
+        self.positionEvent = FakeEvent()
+        self.accountValueEvent = FakeEvent()
+        self.pnlEvent = FakeEvent()
+        self._positions = list(positions)
+        self._account_values = list(account_values)
+        self.tickers = {}
+        self.cancelled = []
+
+    def positions(self, account):
+        return [p for p in self._positions if p.account == account]
+
+    def accountValues(self, account):
+        return [v for v in self._account_values if v.account == account]
+
+    def reqMktData(self, contract):
+        self.tickers[contract.conId] = FakeTicker(contract)
+        return self.tickers[contract.conId]
+
+    def cancelMktData(self, contract):
+        self.cancelled.append(contract.conId)
+
+    def isConnected(self):
+        return False
+
+    def sleep(self, seconds):
+        pass
+
+
+def make_position(con_id, symbol, position, account=ACCOUNT):
+    contract = SimpleNamespace(conId=con_id, symbol=symbol, secType='STK', multiplier='')
+    return SimpleNamespace(account=account, contract=contract, position=position, avgCost=10.0)
+
+
+@pytest.fixture
+def portfolio(tmp_path, monkeypatch):
+    # Contracts from the fake source are already qualified
+    monkeypatch.setattr(portfolio_service, 'qualify_contracts', lambda ib, contracts: contracts)
+    ib = FakeIB([make_position(1, 'AAA', 100), make_position(2, 'BBB', -50)],
+                [SimpleNamespace(account=ACCOUNT, tag='NetLiquidation', value='10000')])
+    live = LivePortfolio(ib, ACCOUNT, snapshot_path=str(tmp_path / 'live.json'), cadence=0)
+    live.start()
+    return live
+
+
+def read_snapshot(live):
+    with open(live.snapshot_path) as f:
+        # Rejects NaN, which json.dump would otherwise write
+        return json.load(f, parse_constant=lambda name: pytest.fail('invalid JSON constant ' + name))
+
+
+def test_ticks_update_totals(portfolio):
+    ib = portfolio.ib
+    ib.tickers[1].price = 20.0
+    ib.tickers[2].price = 40.0
+    ib.pendingTickersEvent.emit([ib.tickers[1], ib.tickers[2]])
+    stats = read_snapshot(portfolio)['stats']
+    assert stats['mkt_value'] == 0
+    assert stats['gross_exposure'] == 0.4
+    assert stats['cash_value'] is None
+
+
+def test_closing_position_writes_snapshot(portfolio):
+    ib = portfolio.ib
+    ib.tickers[1].price = 20.0
+    ib.pendingTickersEvent.emit([ib.tickers[1]])
+    ib.positionEvent.emit(make_position(1, 'AAA', 0))
+    snapshot = read_snapshot(portfolio)
+    assert [row['symbol'] for row in snapshot['positions']] == ['BBB']
+    assert snapshot['stats']['mkt_value'] == 0
+    assert ib.cancelled == [1]
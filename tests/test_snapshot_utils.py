@@ -0,0 +1,35 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+openpyxl = pytest.importorskip('openpyxl')
+pytest.importorskip('pyarrow')
+
+from snapshot_utils import read_sheet, read_sheet_cached
+
+
+def make_workbook(path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Ref Data'
+    ws.append(['ticker', None, 'weight', ' ', None])
+    ws.append(['AAA', 'x', 0.5, 'y', None])
+    ws.append(['BBB', None, 0.5, None, 'z'])
+    wb.save(path)
+
+
+def test_read_sheet_drops_blank_headers(tmp_path):
+    xlsx_path = str(tmp_path / 'book.xlsx')
+    make_workbook(xlsx_path)
+    df = read_sheet(xlsx_path, 'Ref Data')
+    assert list(df.columns) == ['ticker', 'weight']
+    assert df['ticker'].tolist() == ['AAA', 'BBB']
+
+
+def test_read_sheet_cached_round_trips(tmp_path):
+    xlsx_path = str(tmp_path / 'book.xlsx')
+    make_workbook(xlsx_path)
+    cache_path = str(tmp_path / 'cache')
+    first = read_sheet_cached(xlsx_path, 'Ref Data', cache_path)
+    second = read_sheet_cached(xlsx_path, 'Ref Data', cache_path)
+    pd.testing.assert_frame_equal(first, second)
+    assert first['weight'].dtype == 'float64'
@@ -0,0 +1,89 @@
+import json
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('requests')
+
+import squeeze_utils
+from squeeze_utils import SqueezeMetricsClient
+
+BODY = b'date,price,gex\n2024-01-02,4742.83,1.5\n2024-01-03,4704.81,-0.5\n'
+ETAG = '"v1"'
+
+
+@pytest.fixture
+def gexplus_server(stub_server):
+    def gexplus(headers):
+        if headers.get('If-None-Match') == ETAG:
+            return 304, {'ETag': ETAG}, b''
+        return 200, {'ETag': ETAG, 'Content-Type': 'text/csv'}, BODY
+    stub_server.routes['/gexplus'] = gexplus
+    return stub_server
+
+
+@pytest.fixture
+def client(gexplus_server, tmp_path):
+    return SqueezeMetricsClient('key', base_url=gexplus_server.url, cache_path=str(tmp_path), ttl=3600)
+
+
+@pytest.fixture
+def parse_count(monkeypatch):
+    calls = []
+    read_csv = pd.read_csv
+
+    def counting_read_csv(*args, **kwargs):
+        calls.append(1)
+        return read_csv(*args, **kwargs)
+    monkeypatch.setattr(squeeze_utils.pd, 'read_csv', counting_read_csv)
+    return calls
+
+
+def expire(client, endpoint):
+    _, meta_file = client.cache_files(endpoint)
+    with open(meta_file) as f:
+        meta = json.load(f)
+    meta['checked'] -= 2 * client.ttl
+    with open(meta_file, 'w') as f:
+        json.dump(meta, f)
+
+
+def test_first_fetch_stores_body_and_etag(client, gexplus_server):
+    df = client.get_gexplus()
+    assert list(df.columns) == ['date', 'price', 'gex']
+    body_file, meta_file = client.cache_files('gexplus')
+    with open(body_file, 'rb') as f:
+        assert f.read() == BODY
+    with open(meta_file) as f:
+        assert json.load(f)['etag'] == ETAG
+    method, path, headers = gexplus_server.requests[0]
+    assert (method, path) == ('GET', '/gexplus')
+    assert 'If-None-Match' not in headers
+
+
+def test_fetch_within_ttl_makes_no_request(client, gexplus_server):
+    client.get_gexplus()
+    client.get_gexplus()
+    assert len(gexplus_server.requests) == 1
+
+
+def test_expired_entry_is_revalidated(client, gexplus_server):
+    client.get_gexplus()
+    body_file, _ = client.cache_files('gexplus')
+    expire(client, 'gexplus')
+    df = client.get_gexplus()
+    assert len(gexplus_server.requests) == 2
+    assert gexplus_server.requests[1][2].get('If-None-Match') == ETAG
+    with open(body_file, 'rb') as f:
+        assert f.read() == BODY
+    assert len(df) == 2
+
+
+def test_body_parsed_once_per_mtime(client, parse_count):
+    first = client.get_gexplus()
+    expire(client, 'gexplus')
+    second = client.get_gexplus()
+    assert second is first
+    assert len(parse_count) == 1
+    # A forced fetch gets a 304 too, so the body and its parse are kept
+    assert client.get_gexplus(force=True) is first
+    assert len(parse_count) == 1
@@ -0,0 +1,48 @@
+import pickle
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+fakeredis = pytest.importorskip('fakeredis')
+
+import state_utils
+from state_utils import STATE_KEY, get_preds, load_preds, save_preds, save_state
+
+
+@pytest.fixture
+def r():
+    state_utils._preds_cache.clear()
+    return fakeredis.FakeRedis()
+
+
+def make_preds(scale):
+    return pd.DataFrame({'preds': np.arange(3.0) * scale, 'other': np.ones(3) * scale},
+                        index=['AAA', 'BBB', 'CCC'])
+
+
+def test_get_preds_follows_state_writes(r):
+    save_state(r, {'preds_df': make_preds(1)})
+    assert get_preds(r, ['preds'])['preds'].tolist() == [0.0, 1.0, 2.0]
+    save_state(r, {'preds_df': make_preds(2)})
+    assert get_preds(r, ['preds'])['preds'].tolist() == [0.0, 2.0, 4.0]
+
+
+def test_get_preds_skips_unchanged_state(r):
+    save_state(r, {'preds_df': make_preds(1)})
+    # Unreadable without bumping the counter, so any fetch of the blob would fail
+    r.set(STATE_KEY, b'not a pickle')
+    assert get_preds(r, ['preds'])['preds'].tolist() == [0.0, 1.0, 2.0]
+
+
+def test_get_preds_publishes_from_state_written_elsewhere(r):
+    r.set(STATE_KEY, pickle.dumps({'preds_df': make_preds(3)}))
+    assert get_preds(r, ['preds'])['preds'].tolist() == [0.0, 3.0, 6.0]
+    r.incr(STATE_KEY + ':version')
+    r.set(STATE_KEY, pickle.dumps({'preds_df': make_preds(4)}))
+    assert get_preds(r, ['preds'])['preds'].tolist() == [0.0, 4.0, 8.0]
+
+
+def test_full_read_after_subset_read_returns_all_columns(r):
+    save_preds(r, make_preds(1))
+    assert list(load_preds(r, ['preds']).columns) == ['preds']
+    assert list(load_preds(r).columns) == ['preds', 'other']